@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from threading import Lock
+
+
+class BDDOverflow(Exception):
+    pass
+
+
+class BDD(object):
+    ''' Reduced ordered binary decision diagrams over variables numbered
+        from 1, tested in increasing order.
+        Data Structure:
+            nodes: (var, low, high) of each node, referred to by index;
+                0 and 1 are the constant false and true.
+            max_nodes: compiling more nodes raises BDDOverflow.
+    '''
+    FALSE = 0
+    TRUE = 1
+    # variable of the constants, greater than any other
+    TERMINAL = float('inf')
+
+    def __init__(self, max_nodes=None):
+        self.max_nodes = max_nodes
+        self.nodes = [(self.TERMINAL, 0, 0), (self.TERMINAL, 1, 1)]
+        self.unique = {}
+        # copies of a theory share their BDD and may add to it at once
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node(self, var, low, high):
+        if low == high:
+            return low
+        key = (var, low, high)
+        u = self.unique.get(key)
+        if u is None:
+            with self._lock:
+                u = self.unique.get(key)
+                if u is None:
+                    if self.max_nodes is not None \
+                            and len(self.nodes) >= self.max_nodes:
+                        raise BDDOverflow(
+                                'More than {} nodes'.format(self.max_nodes))
+                    u = len(self.nodes)
+                    self.nodes.append(key)
+                    self.unique[key] = u
+        return u
+
+    def clause(self, literals):
+        # the disjunction of literals, given as signed variables
+        u = self.FALSE
+        for literal in sorted(literals, key=abs, reverse=True):
+            if literal > 0:
+                u = self.node(literal, u, self.TRUE)
+            else:
+                u = self.node(-literal, self.TRUE, u)
+        return u
+
+    def conjoin(self, u, v):
+        nodes = self.nodes
+        cache = {}
+
+        def conj(u, v):
+            if u == self.FALSE or v == self.FALSE:
+                return self.FALSE
+            if u == self.TRUE or u == v:
+                return v
+            if v == self.TRUE:
+                return u
+            key = (u, v) if u < v else (v, u)
+            if key not in cache:
+                u_var, u_low, u_high = nodes[u]
+                v_var, v_low, v_high = nodes[v]
+                var = min(u_var, v_var)
+                if u_var != var:
+                    u_low = u_high = u
+                if v_var != var:
+                    v_low = v_high = v
+                cache[key] = self.node(var,
+                        conj(u_low, v_low), conj(u_high, v_high))
+            return cache[key]
+        return conj(u, v)
+
+    def from_clauses(self, clauses):
+        clauses = list(clauses)
+        if len(set(abs(literal) for clause in clauses for literal in clause)) \
+                * 2 > sys.getrecursionlimit():
+            # too deep for the recursive apply
+            raise BDDOverflow('Too many variables')
+        u = self.TRUE
+        # conjoin from the bottom variables up, keeping it small
+        for clause in sorted(clauses, reverse=True,
+                key=lambda clause: min(map(abs, clause)) if clause else 0):
+            u = self.conjoin(u, self.clause(clause))
+            if u == self.FALSE:
+                break
+        return u
+
+    def consistent(self, u, assignment):
+        # u is satisfiable with the variables in `assignment` (var -> bool)
+        nodes = self.nodes
+        seen = set()
+        stack = [u]
+        while stack:
+            u = stack.pop()
+            if u == self.TRUE:
+                return True
+            if u == self.FALSE or u in seen:
+                continue
+            seen.add(u)
+            var, low, high = nodes[u]
+            value = assignment.get(var)
+            if value is None:
+                stack += [low, high]
+            else:
+                stack.append(high if value else low)
+        return False
+
+    def conjoinable(self, u, other, v):
+        # `u` and node `v` of BDD `other` are satisfiable together
+        nodes, other_nodes = self.nodes, other.nodes
+        seen = set()
+        stack = [(u, v)]
+        while stack:
+            u, v = stack.pop()
+            if u == self.FALSE or v == self.FALSE or (u, v) in seen:
+                continue
+            if u == self.TRUE and v == self.TRUE:
+                return True
+            seen.add((u, v))
+            u_var, u_low, u_high = nodes[u]
+            v_var, v_low, v_high = other_nodes[v]
+            var = min(u_var, v_var)
+            if u_var != var:
+                u_low = u_high = u
+            if v_var != var:
+                v_low = v_high = v
+            stack += [(u_low, v_low), (u_high, v_high)]
+        return False
+
+
+if __name__ == '__main__':
+    bdd = BDD()
+    u = bdd.from_clauses([[1, 2], [-1, 3], [-2, 3]])
+    assert bdd.consistent(u, {1: True})
+    assert not bdd.consistent(u, {3: False})
+    assert bdd.from_clauses([[1], [-1]]) == BDD.FALSE
+    other = BDD()
+    assert bdd.conjoinable(u, other, other.from_clauses([[-3, 4]]))
+    assert not bdd.conjoinable(u, other, other.from_clauses([[-3]]))
+    try:
+        BDD(max_nodes=4).from_clauses([[1, 2, 3], [-1, -2, -3]])
+    except BDDOverflow:
+        pass
+    else:
+        assert False
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+''' Run datasets and queries from the command line.
+
+    cli.py run FILE
+        Run a dataset file (.yaml or .json) by its `action`; the answers
+        of `action: query` are written as JSON lines.
+    cli.py query [-l LOGIC] [-t FILE] [-f FACT]... [-r RULE]... [QUERIES]
+        Ask the queries of QUERIES (default: stdin), one per line as
+        `question [formula]`, of the theory of FILE and the given facts
+        and rules. Answers are written as JSON lines.
+
+    Engines and serializers are imported only when used.
+'''
+
+import sys
+import argparse
+
+
+def to_json(obj):
+    import json
+    from symbol import LogicObject
+    return json.dumps(obj,
+            default=lambda o: str(o) if isinstance(o, LogicObject) else o)
+
+
+def make_loader(file_path=None):
+    from dataset import DatasetLoader, JsonDatasetManager
+    if file_path is not None and file_path.endswith('.json'):
+        return DatasetLoader(dataset_manager=JsonDatasetManager())
+    return DatasetLoader()
+
+
+def do_run(args):
+    from dataset import TestFailed
+    try:
+        ret = make_loader(args.file).load(args.file)
+    except TestFailed as e:
+        print(e, file=sys.stderr)
+        return 1
+    if isinstance(ret, tuple):
+        rules, facts = ret
+        print(to_json({'rule': rules, 'fact': facts}))
+    elif ret is not None:
+        # answers of a query action, as they come
+        for answer in ret:
+            print(to_json(answer), flush=True)
+    return 0
+
+
+def do_query(args):
+    from dataset import LOGIC_MAP
+    from dlogic import DefaultRule
+    from symbol import Formula
+    if args.logic not in LOGIC_MAP:
+        print('Unknown logic {}'.format(args.logic), file=sys.stderr)
+        return 2
+    loader = make_loader(args.theory)
+    rules, facts = [], []
+    if args.theory is not None:
+        rules, facts = loader.load(args.theory, action='load')
+    rules += [loader.try_parse(rule, DefaultRule) for rule in args.rule]
+    facts += [loader.try_parse(fact, Formula) for fact in args.fact]
+    logic = LOGIC_MAP[args.logic]()
+    for rule in rules:
+        logic.add_rule(rule)
+    for fact in facts:
+        logic.add_fact(fact)
+    for line in args.queries:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        question, _, formula = line.partition(' ')
+        formula = formula.strip() or None
+        answer = {'question': question, 'formula': formula}
+        try:
+            answer['value'] = loader.query(logic, question, formula)
+        except Exception as e:
+            answer['error'] = str(e)
+        print(to_json(answer), flush=True)
+    return 0
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(
+            description='Reason with default theories.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='run a dataset file')
+    run.add_argument('file')
+    run.set_defaults(func=do_run)
+
+    query = commands.add_parser('query', help='ask queries, one per line')
+    query.add_argument('-l', '--logic', default='spdl1',
+            help='cpdl, cpdl-cegar, spdl1 or spdl2 (default: spdl1)')
+    query.add_argument('-t', '--theory', help='dataset file of the theory')
+    query.add_argument('-f', '--fact', action='append', default=[])
+    query.add_argument('-r', '--rule', action='append', default=[])
+    query.add_argument('queries', nargs='?', type=argparse.FileType('r'),
+            default=sys.stdin, help='query file (default: stdin)')
+    query.set_defaults(func=do_query)
+
+    args = parser.parse_args(argv[1:])
+    from dataset import DatasetFormatError
+    try:
+        return args.func(args)
+    except (DatasetFormatError, IOError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
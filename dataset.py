@@ -3,20 +3,21 @@
 
 from os import path
 import json
-import yaml
 
-from spdl import SPDLogic, AnotherSPDLogic
-from dlogic import DefaultRule, CPDLogic
+from dlogic import DefaultRule
 from symbol import Formula
 from lparser import parse, FormulaSyntaxError
 from visitor import to_latex
+from utils import LazyMap
 
 
-LOGIC_MAP = {
-        'cpdl': CPDLogic,
-        'spdl1': SPDLogic,
-        'spdl2': AnotherSPDLogic,
-        }
+# engines are imported when asked for
+LOGIC_MAP = LazyMap({
+        'cpdl': 'dlogic.CPDLogic',
+        'cpdl-cegar': 'dlogic.CEGARDLogic',
+        'spdl1': 'spdl.SPDLogic',
+        'spdl2': 'spdl.AnotherSPDLogic',
+        })
 
 UNPARSE_MAP = {
         'str': str,
@@ -48,13 +49,22 @@ class DatasetManager(object):
 
 
 class YamlDatasetManager(DatasetManager):
-    _engine = yaml
     _save_options = {
             'default_flow_style': False,
             'allow_unicode': True,
             'encoding': 'utf-8',
             }
 
+    @property
+    def _engine(self):
+        # yaml is only imported when used
+        import yaml
+        return yaml
+
+    @property
+    def _load_options(self):
+        return {'Loader': self._engine.SafeLoader}
+
 
 class JsonDatasetManager(DatasetManager):
     _engine = json
@@ -70,6 +80,11 @@ class QueryAsker(object):
     def query_all_extensions(self, logic, formula):
         return list(logic.all_extensions())
 
+    def query_extension_models(self, logic, formula):
+        # distinct atom assignments in each extension
+        return [list(extension.models())
+                for extension in logic.all_extensions()]
+
     def query_credulous_entail(self, logic, formula):
         f = self.dataset_loader.try_parse(formula, Formula)
         return logic.credulous_entail(f)
@@ -86,17 +101,34 @@ class QueryAsker(object):
         f = self.dataset_loader.try_parse(formula, Formula)
         return not logic.skeptical_entail(f)
 
+    def _parse_all(self, formulas):
+        return [self.dataset_loader.try_parse(formula, Formula)
+                for formula in formulas]
+
+    def query_many_credulous_entail(self, logic, formulas):
+        return logic.credulous_entail_many(self._parse_all(formulas))
+
+    def query_many_not_credulous_entail(self, logic, formulas):
+        return [not ret for ret in
+                logic.credulous_entail_many(self._parse_all(formulas))]
+
+    def query_many_skeptical_entail(self, logic, formulas):
+        return logic.skeptical_entail_many(self._parse_all(formulas))
+
+    def query_many_not_skeptical_entail(self, logic, formulas):
+        return [not ret for ret in
+                logic.skeptical_entail_many(self._parse_all(formulas))]
+
 
 class DatasetLoader(object):
     format = 'str'
     dataset_manager = YamlDatasetManager()
-    query_asker = QueryAsker()
 
     def __init__(self, dataset_manager=None, query_asker=None):
         if dataset_manager:
             self.dataset_manager = dataset_manager
-        if query_asker:
-            self.query_asker = query_asker
+        # not shared: it asks with the format of this loader
+        self.query_asker = query_asker or QueryAsker()
         self.query_asker.dataset_loader = self
 
     def ensure(self, b):
@@ -111,10 +143,12 @@ class DatasetLoader(object):
         if not isinstance(b, type_):
             raise DatasetFormatError('Illegal data!')
 
-    def load(self, file_path):
+    def load(self, file_path, action=None):
+        # `action` overrides the one of the file
         config = self.dataset_manager.load(file_path)
         self.ensure_type(config, dict)
-        action = config.get('action', 'load')
+        if action is None:
+            action = config.get('action', 'load')
         do = getattr(self, 'do_{}'.format(action), None)
         self.ensure(do is not None)
         config.setdefault('format', 'str')
@@ -146,6 +180,52 @@ class DatasetLoader(object):
             df = self.make_default(dataset)
             self.test_dataset(dataset, df, logic_maker)
 
+    def do_query(self, config):
+        ''' Answer the questions of the datasets, one at a time as
+            {dataset, question, formula, value}, where `dataset` is the
+            path to the dataset, e.g. '1.add.0'.
+        '''
+        logic_maker = LOGIC_MAP.get(config.get('logic', 'spdl1'), None)
+        self.ensure(logic_maker is not None)
+        datasets = config.get('dataset', None)
+        if datasets is None:
+            datasets = [config]
+        return self.query_datasets(datasets, logic_maker)
+
+    def query_datasets(self, datasets, logic_maker, position=()):
+        self.ensure_type(datasets, list)
+        for i, dataset in enumerate(datasets):
+            self.ensure_type(dataset, dict)
+            df = self.make_default(dataset)
+            yield from self.query_dataset(dataset, df, logic_maker,
+                    position + (i,))
+
+    def query_dataset(self, dataset, df, logic_maker, position):
+        logic = self.make_logic(df, logic_maker)
+        where = '.'.join(map(str, position))
+        # both answered by one enumeration
+        extensions = None
+        for name in ('has_extension', 'all_extensions'):
+            if name in dataset:
+                if extensions is None:
+                    extensions = list(logic.all_extensions())
+                value = extensions
+                if name == 'has_extension':
+                    value = len(extensions)
+                yield {'dataset': where, 'question': name,
+                        'formula': None, 'value': value}
+        for name in ('credulous_entail', 'skeptical_entail',
+                'not_credulous_entail', 'not_skeptical_entail'):
+            l = dataset.get(name, [])
+            self.ensure_type(l, list)
+            for f, ret in zip(l, self.query_many(logic, name, l)):
+                yield {'dataset': where, 'question': name,
+                        'formula': f, 'value': ret}
+        add = dataset.get('add', None)
+        if add:
+            yield from self.query_datasets(add, logic.copy,
+                    position + ('add',))
+
     def make_default(self, dataset):
         rules = dataset.get('rule', [])
         self.ensure_type(rules, list)
@@ -161,13 +241,17 @@ class DatasetLoader(object):
             _facts.append(f)
         return (_rules, _facts)
 
-    def test_dataset(self, dataset, df, logic_maker):
+    def make_logic(self, df, logic_maker):
         logic = logic_maker()
         rules, facts = df
         for rule in rules:
             logic.add_rule(rule)
         for fact in facts:
             logic.add_fact(fact)
+        return logic
+
+    def test_dataset(self, dataset, df, logic_maker):
+        logic = self.make_logic(df, logic_maker)
         has_extension = dataset.get('has_extension', None)
         if has_extension is not None:
             self.ensure_type(has_extension, int)
@@ -179,8 +263,8 @@ class DatasetLoader(object):
                 'not_credulous_entail', 'not_skeptical_entail'):
             l = dataset.get(name, [])
             self.ensure_type(l, list)
-            for f in l:
-                if not self.query(logic, name, f):
+            for f, ret in zip(l, self.query_many(logic, name, l)):
+                if not ret:
                     raise TestFailed(
                             "Test failed:\n  Logic {}\n  should {} `{}'"\
                                     .format(logic, name, f))
@@ -194,6 +278,14 @@ class DatasetLoader(object):
             raise DatasetFormatError('Unknown question')
         return func(logic, formula)
 
+    def query_many(self, logic, question, formulas):
+        func = getattr(self.query_asker, 'query_many_{}'.format(question),
+                None)
+        if func is None:
+            return [self.query(logic, question, formula)
+                    for formula in formulas]
+        return func(logic, formulas)
+
     def try_parse(self, s, type_=Formula):
         try:
             r = parse(s, format=self.format)
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
 
-from itertools import combinations
-from utils import subseteq
-from symbol import LogicObject
-from plogic import CPLogic
+import pycosat
+from itertools import chain, combinations
+from collections import Counter, OrderedDict
+from utils import bits, to_mask, DisjointSet, strongly_connected
+from symbol import LogicObject, Not, symbol_table
+from plogic import CPLogic, fold_dual
+from persistent import PersistentList
+from visitor import collect_atoms
 
 
 class DefaultRule(LogicObject):
@@ -22,6 +26,14 @@ class DefaultRule(LogicObject):
     def __str__(self):
         return '{} : {} / {}'.format(self.pre, self.jus, self.cons)
 
+    def __eq__(self, obj):
+        return self.__class__ == obj.__class__ \
+                and (self.pre, self.jus, self.cons) \
+                == (obj.pre, obj.jus, obj.cons)
+
+    def __hash__(self):
+        return hash((self.pre, self.jus, self.cons))
+
 
 class DefaultLogic(LogicObject):
     ground_logic = CPLogic
@@ -42,20 +54,102 @@ class DefaultLogic(LogicObject):
                 self.add_fact(formula)
 
     def reset(self):
-        self.d = []
+        self.d = PersistentList()
         self.w = self.ground_logic()
+        self._cache = {}
 
     def copy(self):
+        # in constant time: `d` and `w` are persistent
         obj = self.__class__()
-        obj.d = self.d.copy()
+        obj.d = self.d
         obj.w = self.w.copy()
         return obj
 
     def add_fact(self, formula):
         self.w.add(formula)
+        self._cache.clear()
 
     def add_rule(self, rule):
-        self.d.append(rule)
+        self.d = self.d.append(rule)
+        self._cache.clear()
+
+    def remove_fact(self, formula):
+        self.w.remove(formula)
+        self._cache.clear()
+
+    def remove_rule(self, rule):
+        try:
+            self.d = self.d.remove(rule)
+        except ValueError:
+            raise ValueError('{} is not in the theory'.format(rule)) \
+                    from None
+        self._cache.clear()
+
+    def _cached(self, key, make):
+        # memoize `make()` until the theory changes
+        if key not in self._cache:
+            self._cache[key] = make()
+        return self._cache[key]
+
+    def _rule_atoms(self):
+        # atom names of (pre, jus, cons) for each default
+        def make():
+            return [tuple([atom.name for atom in collect_atoms(formula)]
+                for formula in (d.pre, d.jus, d.cons)) for d in self.d]
+        return self._cached('rule_atoms', make)
+
+    def _fact_atoms(self):
+        def make():
+            return [[atom.name for atom in collect_atoms(formula)]
+                    for formula in self.w.formulas]
+        return self._cached('fact_atoms', make)
+
+    def decompose(self):
+        ''' Split the theory into parts which can be solved one after
+            another. Atoms are linked by the facts and by the justification
+            and consequent of each default; a part reads the components
+            mentioned by the prerequisites of its defaults, and parts
+            reading each other are merged.
+            Return a list of (part, reads) in solving order, where a part
+            is (rules, facts): a bitset over `d` and indices of
+            `w.formulas`, and `reads` is the list of parts it depends on.
+            Parts without defaults are only listed in `reads`.
+        '''
+        def make():
+            components = DisjointSet()
+            for names in self._fact_atoms():
+                components.union(names)
+            for pre, jus, cons in self._rule_atoms():
+                components.union(jus + cons)
+            rules, facts, graph = {}, {}, {}
+            for i, (pre, jus, cons) in enumerate(self._rule_atoms()):
+                root = components.find((jus + cons)[0])
+                rules[root] = rules.get(root, 0) | 1 << i
+                reads = graph.setdefault(root, {})
+                for name in pre:
+                    reads[components.find(name)] = True
+            for i, names in enumerate(self._fact_atoms()):
+                if names:
+                    facts.setdefault(components.find(names[0]), []).append(i)
+            for reads in list(graph.values()):
+                for root in reads:
+                    graph.setdefault(root, {})
+            merged, parts = {}, []
+            for roots in strongly_connected(graph):
+                k = len(parts)
+                part_rules, part_facts, part_reads = 0, [], {}
+                for root in roots:
+                    merged[root] = k
+                for root in roots:
+                    part_rules |= rules.get(root, 0)
+                    part_facts += facts.get(root, [])
+                    for read in graph[root]:
+                        if merged[read] != k:
+                            part_reads[merged[read]] = True
+                parts.append(((part_rules, tuple(part_facts)), part_reads))
+            return [(part, [parts[j][0] for j in reads])
+                    for part, reads in parts if part[0]]
+        return self._cached('decompose', make)
 
     def all_extensions(self):
         raise NotImplementedError
@@ -64,16 +158,32 @@ class DefaultLogic(LogicObject):
         raise NotImplementedError
 
     def credulous_entail(self, formula):
-        for extension in self.all_extensions():
-            if extension.entail(formula):
-                return True
-        return False
+        return self.credulous_entail_many([formula])[0]
 
     def skeptical_entail(self, formula):
+        return self.skeptical_entail_many([formula])[0]
+
+    def _entail_many(self, formulas, decisive):
+        # one pass over the extensions, asking each extension at once for
+        # all formulas not settled yet; a formula is settled by the first
+        # extension whose answer is `decisive`
+        formulas = list(formulas)
+        results = [not decisive] * len(formulas)
         for extension in self.all_extensions():
-            if not extension.entail(formula):
-                return False
-        return True
+            pending = [i for i, ret in enumerate(results) if ret != decisive]
+            if not pending:
+                break
+            rets = extension.entail_many([formulas[i] for i in pending])
+            for i, ret in zip(pending, rets):
+                if ret == decisive:
+                    results[i] = decisive
+        return results
+
+    def credulous_entail_many(self, formulas):
+        return self._entail_many(formulas, True)
+
+    def skeptical_entail_many(self, formulas):
+        return self._entail_many(formulas, False)
 
     def __repr__(self):
         return '{}({}, {})'.format(self.__class__.__name__,
@@ -84,49 +194,594 @@ class DefaultLogic(LogicObject):
         return '({{{}}}, {})'.format(', '.join(map(str, self.d)), self.w)
 
 
-class CPDLogic(DefaultLogic):
-    def _build_extension(self, gd):
+class Extension(LogicObject):
+    ''' An extension of a default theory: `w` and the consequents of
+        the generating defaults `gd`, a bitset over `d`. It shares the
+        compiled theory of the logic it was found by, and answers `sat`
+        and `entail` by assuming the selectors of its consequents; only
+        `build()` makes a theory of its own.
+        `inconsistents` are the names of the atoms taken as inconsistent.
+    '''
+    def __init__(self, logic, gd, inconsistents=()):
+        # `w` and `d` are persistent: the extension keeps them as they are
+        self.w = logic.w.copy()
+        self.d = logic.d
+        self.gd = gd
+        self.inconsistents = tuple(inconsistents)
+        self.compiled, selectors = logic._compiled()
+        self.assumptions = [selectors[i][2] for i in bits(gd)]
+
+    @property
+    def formulas(self):
+        return list(self.w.formulas) + [self.d[i].cons for i in bits(self.gd)]
+
+    def build(self):
+        # the extension as a theory of the ground logic
         extension = self.w.copy()
-        for rule in gd:
-            extension.add(rule.cons)
+        for i in bits(self.gd):
+            extension.add(self.d[i].cons)
         return extension
 
-    def _test_rule(self, extension, rule):
-        return extension.sat(rule.jus)
-
-    def is_extension(self, rules):
-        extension = self._build_extension(rules)
-        ds = [d for d in self.d if self._test_rule(extension, d)]
-        if not subseteq(rules, ds):
-            return False
-        iter_ext = self.w.copy()
-        applied_rules = []
-        while ds:
-            new_ds = ds[:]
-            for d in ds:
-                if iter_ext.entail(d.pre):
-                    if d not in rules:
-                        return False
-                    iter_ext.add(d.cons)
-                    applied_rules.append(d)
-                    new_ds.remove(d)
-            if len(new_ds) == len(ds):
-                break
-            ds = new_ds
-        return subseteq(rules, applied_rules)
+    def sat(self, formula=None):
+        if formula is not None:
+            formula = self.w.classical(formula)
+        return self.compiled.sat(formula, assumptions=self.assumptions)
+
+    def entail(self, formula):
+        return not self.compiled.sat(Not(self.w.classical(formula)),
+                assumptions=self.assumptions)
+
+    def sat_many(self, formulas):
+        return self.compiled.sat_many([self.w.classical(formula)
+            for formula in formulas], assumptions=self.assumptions)
+
+    def entail_many(self, formulas):
+        return [not ret for ret in self.compiled.sat_many(
+            [Not(self.w.classical(formula)) for formula in formulas],
+            assumptions=self.assumptions)]
+
+    def models(self, atoms=None):
+        ''' Models of the extension over the original atoms (all of them
+            by default). Where the ground logic renames negations, as the
+            one of AnotherSPDLogic does, an atom and its renamed negation
+            give one value, as in `SPPLogic.models`.
+        '''
+        theory = self.build()
+        duals, originals = symbol_table.duals, symbol_table.originals
+        if atoms is None:
+            atoms = OrderedDict((originals.get(name, name), True)
+                    for name in theory.atoms if not name.startswith('#'))
+        atoms = list(atoms)
+        renamed = dict((name, duals[name]) for name in atoms
+                if duals.get(name) in theory.atoms)
+        for model in theory.models(atoms + list(renamed.values())):
+            values = {}
+            for name in atoms:
+                value = model[name]
+                if name in renamed:
+                    value = fold_dual(value, model[renamed[name]])
+                values[name] = value
+            yield values
+
+    def backbone(self):
+        return self.build().backbone()
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__,
+                ', '.join(map(repr, self.formulas)))
+
+    def __str__(self):
+        return '{{{}}}'.format(', '.join(map(str, self.formulas)))
+
+
+class CPDLogic(DefaultLogic):
+    ''' Defaults are referred to by their position in `d`, and sets of
+        defaults (generating, applicable, applied) are bitsets over
+        these positions: bit i stands for `d[i]`.
+        `counters` tells how many candidate sets were checked or pruned,
+        how many nogoods were learned and extensions found. `progress`,
+        if set, is called with `counters` at each candidate and extension;
+        it may raise to stop the reasoning.
+        Extensions found for a theory or one of its parts are kept in
+        `part_results`, keyed by the content of the part, so they survive
+        adding and removing facts and rules elsewhere, and are shared by
+        copies.
+    '''
+    part_results_size = 1024
+    progress = None
+
+    def reset(self):
+        super(CPDLogic, self).reset()
+        self.counters = Counter()
+        self.part_results = OrderedDict()
+
+    def copy(self):
+        obj = super(CPDLogic, self).copy()
+        obj.part_results = self.part_results
+        obj.progress = self.progress
+        return obj
+
+    def _count(self, name):
+        self.counters[name] += 1
+        if self.progress is not None:
+            self.progress(self.counters)
+
+    def _content_key(self, rules, formulas):
+        return (self.w.__class__.__name__, self.w.context_key(),
+                tuple(map(repr, rules)), tuple(map(repr, formulas)))
+
+    def _reusable(self, key, make):
+        # the items of generator `make()`, remembered under `key`
+        # once it is exhausted
+        # other threads may drop entries meanwhile
+        results = self.part_results
+        try:
+            found = results[key]
+            results.move_to_end(key)
+        except KeyError:
+            pass
+        else:
+            self.counters['reused'] += 1
+            yield from found
+            return
+        found = []
+        for item in make():
+            found.append(item)
+            yield item
+        results[key] = found
+        try:
+            while len(results) > self.part_results_size:
+                results.popitem(last=False)
+        except KeyError:
+            pass
+
+    def _fact_components(self):
+        # connected components of atoms linked by the facts
+        def make():
+            components = DisjointSet()
+            for names in self._fact_atoms():
+                components.union(names)
+            return components
+        return self._cached('fact_components', make)
+
+    def _compiled(self):
+        ''' `w` compiled once, with the prerequisite (negated),
+            justification and consequent of each default added under
+            selectors: a closure state or candidate extension is just the
+            selectors of its consequents, assumed by each solver call.
+            Return the compiled theory and the (pre, jus, cons) selectors
+            of each default.
+        '''
+        def make():
+            theory = self.w.compile()
+            classical = self.w.classical
+            selectors = [(theory.add_guarded(Not(classical(d.pre))),
+                    theory.add_guarded(classical(d.jus)),
+                    theory.add_guarded(classical(d.cons))) for d in self.d]
+            return theory, selectors
+        return self._cached('compiled', make)
+
+    def _assumptions(self, gd, *selectors):
+        theory, rule_selectors = self._compiled()
+        return [rule_selectors[i][2] for i in bits(gd)] + list(selectors)
+
+    def _consistent(self, gd, i):
+        # the justification of `d[i]` is consistent with `gd`'s extension
+        theory, selectors = self._compiled()
+        return theory.sat(assumptions=self._assumptions(gd, selectors[i][1]))
+
+    def _derivable(self, gd, i):
+        # the prerequisite of `d[i]` is entailed by `gd`'s extension
+        theory, selectors = self._compiled()
+        return not theory.sat(
+                assumptions=self._assumptions(gd, selectors[i][0]))
+
+    def _free_rules(self):
+        # prerequisite-free defaults: the prerequisite is entailed by `w`,
+        # e.g. it is the fact `\top`
+        def make():
+            return to_mask(i for i, d in enumerate(self.d)
+                    if d.pre in self.w.formulas or self._derivable(0, i))
+        return self._cached('free_rules', make)
+
+    def _normal_rules(self):
+        # normal defaults: the justification is the consequent
+        def make():
+            return to_mask(i for i, d in enumerate(self.d) if d.jus == d.cons)
+        return self._cached('normal_rules', make)
+
+    def _is_normal(self):
+        return self._normal_rules() == (1 << len(self.d)) - 1
+
+    def _closure(self, gd, ds):
+        ''' Apply the defaults in `ds` to `w` until a fixpoint is reached,
+            return the bitset of applied defaults, or None once a default
+            not in `gd` becomes applicable.
+            A new consequent can only make those prerequisites entailed
+            which share a component of the atom graph with it, so only
+            these are tested again; an inconsistent closure entails every
+            prerequisite and is caught by the final check.
+        '''
+        rule_atoms = self._rule_atoms()
+        free = self._free_rules()
+        components = self._fact_components().copy()
+        theory, selectors = self._compiled()
+        pending = todo = ds
+        applied = 0
+        while todo:
+            bit = todo & -todo
+            todo ^= bit
+            i = bit.bit_length() - 1
+            if not (free & bit or self._derivable(applied, i)):
+                continue
+            if not gd & bit:
+                return None
+            applied |= bit
+            pending ^= bit
+            root = components.union(rule_atoms[i][2])
+            for j in bits(pending & ~todo):
+                if any(components.find(name) == root
+                        for name in rule_atoms[j][0]):
+                    todo |= 1 << j
+        if pending and not theory.sat(assumptions=self._assumptions(applied)):
+            if pending & ~gd:
+                return None
+            applied |= pending
+        return applied
+
+    def _check(self, gd):
+        ''' Test whether `gd` generates an extension, return
+            (True, None, False) if so; otherwise return
+            (False, nogood, below), where `nogood` is None or a bitset none
+            of whose supersets generates one, and `below` tells whether no
+            subset of `gd` generates one either.
+        '''
+        self._count('candidates')
+        for i in bits(gd):
+            if not self._consistent(gd, i):
+                # the justification stays inconsistent for supersets,
+                # keep only the consequents needed for that
+                nogood = gd
+                for j in bits(gd & ~(1 << i)):
+                    core = nogood & ~(1 << j)
+                    if not self._consistent(core, i):
+                        nogood = core
+                return False, nogood, False
+        free = self._free_rules()
+        ds = gd
+        for i in bits((1 << len(self.d)) - 1 & ~gd):
+            bit = 1 << i
+            if self._consistent(gd, i):
+                if free & bit:
+                    # applicable right away, but not generating; with
+                    # fewer consequents it stays consistent
+                    return False, None, True
+                ds |= bit
+        applied = self._closure(gd, ds)
+        return applied is not None and not gd & ~applied, None, False
+
+    def is_extension(self, gd):
+        return self._check(gd)[0]
+
+    def _applicable(self, gd, i):
+        return (self._free_rules() >> i & 1 or self._derivable(gd, i)) \
+                and self._consistent(gd, i)
+
+    def _normal_extensions(self):
+        ''' Extensions of a normal default theory are exactly the results
+            of applying applicable defaults one at a time until none is
+            left. Branch on the first applicable default: apply it, or
+            leave it out, which only pays if it gets blocked later on.
+        '''
+        everything = (1 << len(self.d)) - 1
+        stack = [(0, 0)]
+        while stack:
+            gd, out = stack.pop()
+            self._count('candidates')
+            for i in bits(everything & ~(gd | out)):
+                if self._applicable(gd, i):
+                    break
+            else:
+                if not any(self._applicable(gd, i) for i in bits(out)):
+                    yield gd
+                continue
+            bit = 1 << i
+            rest = everything & ~(gd | out | bit)
+            # leaving `d[i]` out is hopeless if no remaining consequents
+            # can block it
+            if not self._consistent(gd | rest, i):
+                stack.append((gd, out | bit))
+            stack.append((gd | bit, out))
+
+    def _unusable_rules(self):
+        # defaults which are never generating: the justification
+        # contradicts the facts, or the prerequisite is not derivable
+        # even with the consequents of all other defaults at hand
+        def make():
+            everything = (1 << len(self.d)) - 1
+            usable = to_mask(i for i in range(len(self.d))
+                    if self._consistent(0, i))
+            return everything & ~self._closure(everything, usable)
+        return self._cached('unusable_rules', make)
+
+    def _general_extensions(self):
+        ''' Check the candidates by increasing size, skipping those which
+            contain a nogood: a set of defaults which failed a check for a
+            reason that holds for all its supersets, or which generates an
+            extension already.
+        '''
+        counters = self.counters
+        unusable = self._unusable_rules()
+        usable = [i for i in range(len(self.d)) if not unusable >> i & 1]
+        counters['pruned'] += (1 << len(self.d)) - (1 << len(usable))
+        nogoods = []
+        for r in range(len(usable) + 1):
+            for indices in combinations(usable, r):
+                gd = to_mask(indices)
+                if any(not nogood & ~gd for nogood in nogoods):
+                    counters['pruned'] += 1
+                    continue
+                ok, nogood = self._check(gd)[:2]
+                if ok:
+                    nogood = gd
+                    yield gd
+                if nogood is not None:
+                    nogoods.append(nogood)
+                    counters['nogoods'] += 1
+
+    def _guess_extensions(self, learned=None, block=None):
+        ''' Let a SAT solver guess the generating defaults, one selector
+            variable per default, and check each guess against the ground
+            logic; yield the guesses generating an extension. Every
+            checked guess is fed back to the guesser as a blocking clause:
+            a failed guess blocks all its supersets when the check found a
+            nogood, all its subsets when these fail too, and itself
+            otherwise. Extensions never contain each other, so a found one
+            blocks both its subsets and supersets.
+            These clauses are added to `learned`, which other searches of
+            the same theory may start from; those of an extension only once
+            the search goes on past it.
+            `block(gd)`, if given, may return a clause over the selectors
+            which rules out the guess `gd` and others like it unchecked;
+            these clauses are kept apart.
+        '''
+        n = len(self.d)
+        everything = (1 << n) - 1
+
+        def supersets(gd):
+            return [-(i + 1) for i in bits(gd)]
+
+        def subsets(gd):
+            return [i + 1 for i in bits(everything & ~gd)]
+
+        if learned is None:
+            learned = [[-(i + 1)] for i in bits(self._unusable_rules())]
+        blocked = []
+        while True:
+            model = pycosat.solve(chain(learned, blocked), vars=n)
+            if model in ('UNSAT', 'UNKNOWN'):
+                return
+            gd = to_mask(literal - 1 for literal in model if literal > 0)
+            clause = block(gd) if block is not None else None
+            if clause is not None:
+                blocked.append(clause)
+                continue
+            ok, nogood, below = self._check(gd)
+            if ok:
+                clauses = [supersets(gd), subsets(gd)]
+            elif nogood is not None:
+                self.counters['nogoods'] += 1
+                clauses = [supersets(nogood)]
+            elif below:
+                clauses = [subsets(gd)]
+            else:
+                clauses = [supersets(gd) + subsets(gd)]
+            if ok:
+                yield gd
+            # an empty clause leaves no guess
+            learned += clauses
+
+    def _plain_extensions(self):
+        if self._is_normal():
+            return self._normal_extensions()
+        return self._general_extensions()
+
+    def _part_extensions(self, part, reads, gd):
+        # extensions of one part, given the generating defaults `gd` chosen
+        # for the parts it reads
+        rules, facts = part
+        formulas = [self.w.formulas[i] for i in facts]
+        for read_rules, read_facts in reads:
+            formulas += [self.w.formulas[i] for i in read_facts]
+            formulas += [self.d[i].cons for i in bits(gd & read_rules)]
+        indices = list(bits(rules))
+        d = [self.d[i] for i in indices]
+
+        def make():
+            logic = self.__class__()
+            logic.d = PersistentList(d)
+            logic.w = self.w.subtheory(formulas)
+            logic.counters = self.counters
+            logic.progress = self.progress
+            return logic._plain_extensions()
+        for sub_gd in self._reusable(self._content_key(d, formulas), make):
+            yield to_mask(indices[i] for i in bits(sub_gd))
+
+    def _combiner(self, parts):
+        ''' Extensions of the whole theory are the combinations of the
+            extensions of its parts, each solved in the context of the
+            parts it reads. `combine(k, gd, end)` yields the combinations
+            of parts k..end-1 on top of `gd`; the results of a part are
+            kept for each context.
+        '''
+        results = {}
+
+        def combine(k, gd, end):
+            if k == end:
+                yield gd
+                return
+            part, reads = parts[k]
+            key = (k, tuple(gd & rules for rules, facts in reads))
+            if key not in results:
+                results[key] = list(self._part_extensions(part, reads, gd))
+            for sub_gd in results[key]:
+                yield from combine(k + 1, gd | sub_gd, end)
+        return combine
+
+    def _parts(self):
+        # the parts of the theory, or None if it does not split;
+        # an inconsistent `w` has a single extension which
+        # would not split into parts
+        if len(self.d) > 1 and self._cached('w_sat', self.w.sat):
+            parts = self.decompose()
+            if len(parts) > 1:
+                return parts
+        return None
+
+    def _extensions(self):
+        # generating defaults of all extensions
+        parts = self._parts()
+        if parts is not None:
+            return self._combiner(parts)(0, 0, len(parts))
+        return self._reusable(self._content_key(self.d, self.w.formulas),
+                self._plain_extensions)
+
+    def _goal_parts(self, parts, formula):
+        # reorder `parts`: first the parts sharing atoms with `formula`
+        # together with the parts they read, then the others;
+        # return the reordered parts and the number of relevant ones
+        def make():
+            rule_atoms = self._rule_atoms()
+            fact_atoms = self._fact_atoms()
+            part_atoms = []
+            for (rules, facts), reads in parts:
+                names = set()
+                for i in bits(rules):
+                    names.update(rule_atoms[i][1] + rule_atoms[i][2])
+                for i in facts:
+                    names.update(fact_atoms[i])
+                part_atoms.append(names)
+            return part_atoms
+        part_atoms = self._cached('part_atoms', make)
+        names = set(atom.name for atom in collect_atoms(formula))
+        index = dict((part[0], k) for k, (part, reads) in enumerate(parts))
+        relevant = set()
+        todo = [k for k, atoms in enumerate(part_atoms) if atoms & names]
+        while todo:
+            k = todo.pop()
+            if k not in relevant:
+                relevant.add(k)
+                todo += [index[rules] for rules, facts in parts[k][1]
+                        if rules]
+        ordered = [parts[k] for k in sorted(relevant)] + \
+                [parts[k] for k in range(len(parts)) if k not in relevant]
+        return ordered, len(relevant)
+
+    def _goal_entail(self, parts, formula, decisive):
+        ''' Only the parts sharing atoms with `formula`, and those they
+            read, decide whether an extension entails it: search their
+            combinations for one whose answer is `decisive`, then check
+            that the rest of the theory completes it to an extension.
+        '''
+        ordered, relevant = self._goal_parts(parts, formula)
+        combine = self._combiner(ordered)
+        for gd in combine(0, 0, relevant):
+            if Extension(self, gd).entail(formula) == decisive:
+                for full_gd in combine(relevant, gd, len(ordered)):
+                    return decisive
+        return not decisive
+
+    def _relevant_rules(self, formula):
+        # the defaults whose consequents share a component of the atom
+        # graph, linked by the facts and the consequents, with `formula`:
+        # in a consistent extension only they decide whether it is entailed
+        def make():
+            components = self._fact_components().copy()
+            for pre, jus, cons in self._rule_atoms():
+                components.union(cons)
+            return dict((name, components.find(name))
+                    for name in list(components.parent))
+        roots = self._cached('consequent_components', make)
+        touched = set(roots.get(atom.name) for atom in collect_atoms(formula))
+        return to_mask(i for i, (pre, jus, cons)
+                in enumerate(self._rule_atoms())
+                if any(roots[name] in touched for name in cons))
+
+    def _goal_search(self, formulas, decisive):
+        ''' Guess extensions as `_guess_extensions` does, but ask each
+            guess about a formula before checking it: the answer only
+            depends on its relevant defaults, and grows with them. So a
+            guess whose relevant defaults answer wrong is ruled out
+            unchecked, with all the guesses whose relevant defaults are a
+            subset (a credulous query) or a superset (a skeptical one):
+            a skeptical query looks for an extension consistent with the
+            negated formula.
+            The extensions found and what the checks learned do not
+            depend on the formulas: they are kept for later searches
+            until the theory changes.
+        '''
+        theory, selectors = self._compiled()
+        learned, found = self._cached('guesses', lambda: (
+            [[-(i + 1)] for i in bits(self._unusable_rules())], []))
+        results = []
+        for formula in formulas:
+            relevant = self._relevant_rules(formula)
+            query = Not(self.w.classical(formula))
+
+            def answer(gd):
+                return not theory.sat(query,
+                        assumptions=self._assumptions(gd & relevant))
+
+            def block(gd):
+                if answer(gd) == decisive:
+                    return None
+                part = gd & relevant
+                if decisive:
+                    return [i + 1 for i in bits(relevant & ~part)]
+                return [-(i + 1) for i in bits(part)]
+            ret = any(answer(gd) == decisive for gd in found)
+            if not ret:
+                for gd in self._guess_extensions(learned, block):
+                    found.append(gd)
+                    ret = True
+                    break
+            results.append(decisive if ret else not decisive)
+        return results
+
+    def _entail_many(self, formulas, decisive):
+        parts = self._parts()
+        if parts is not None:
+            return [self._goal_entail(parts, formula, decisive)
+                    for formula in formulas]
+        key = self._content_key(self.d, self.w.formulas)
+        if len(self.d) < 2 or key in self.part_results \
+                or not self._cached('w_sat', self.w.sat):
+            # known extensions are cheaper to ask; an inconsistent `w`
+            # is its only extension
+            return super(CPDLogic, self)._entail_many(formulas, decisive)
+        return self._goal_search(formulas, decisive)
 
     def all_extensions(self):
-        for r in range(len(self.d) + 1):
-            for rules in combinations(self.d, r):
-                if self.is_extension(rules):
-                    yield self._build_extension(rules)
+        for gd in self._extensions():
+            self._count('extensions')
+            yield Extension(self, gd, self.w.context_key())
 
     def has_extension(self):
-        for extension in self.all_extensions():
+        if self._is_normal():
+            # normal default theories always have an extension
+            return True
+        for gd in self._extensions():
             return True
         return False
 
 
+class CEGARDLogic(CPDLogic):
+    ''' Find the extensions by letting a SAT solver guess the generating
+        defaults, see `_guess_extensions`.
+    '''
+    def _plain_extensions(self):
+        return self._guess_extensions()
+
 if __name__ == '__main__':
     from lparser import parse
     from visitor import to_latex
@@ -168,3 +823,113 @@ if __name__ == '__main__':
     assert not t.skeptical_entail(parse('p'))
     assert not t.skeptical_entail(parse('q'))
     assert len(list(t.all_extensions())) == 2
+
+    t.reset()
+    t.add_fact(parse('a->b'))
+    t.add_fact(parse('\\top'))
+    t.add_rule(parse('b:c/c'))
+    t.add_rule(parse('\\top:a/a'))
+    assert t.skeptical_entail(parse('c'))
+    assert len(list(t.all_extensions())) == 1
+
+    t.reset()
+    t.add_fact(parse('T'))
+    t.add_rule(parse('T:p/p'))
+    t.add_rule(parse('T:!p/!p'))
+    t.add_rule(parse('p:q/q'))
+    assert t._is_normal()
+    assert len(list(t.all_extensions())) == 2
+    assert t.credulous_entail(parse('q'))
+    assert not t.skeptical_entail(parse('q'))
+
+    t.reset()
+    t.add_fact(parse('T'))
+    t.add_fact(parse('a->b'))
+    for rule in ['T:!p/q', 'T:!q/p', 'T:x/a', 'b:y/y',
+            'T:!z/c', 'T:!c/z', 'c:!v/w', 'c:!w/v']:
+        t.add_rule(parse(rule))
+    assert len(t.decompose()) == 5
+    assert len(list(t.all_extensions())) == 6
+    assert t.skeptical_entail(parse('y'))
+    assert t.credulous_entail(parse('c & w & p'))
+    assert not t.credulous_entail(parse('z & w'))
+    t.add_rule(parse('T:!o/o'))
+    assert not t.credulous_entail(parse('c & w & p'))
+    assert t.skeptical_entail(parse('!y'))
+
+    t.reset()
+    t.add_fact(parse('T'))
+    t.add_rule(parse('T:!p/q'))
+    t.add_rule(parse('T:!q/p'))
+    t.add_rule(parse('p:!r/!q'))
+    t.add_rule(parse('s:u/u'))
+    assert len(list(t.all_extensions())) == 2
+    assert t.counters['pruned'] > 0 and t.counters['nogoods'] > 0
+
+    t = CEGARDLogic()
+    t.add_fact(parse('T'))
+    t.add_rule(parse('T:!p/q'))
+    t.add_rule(parse('T:!q/p'))
+    t.add_rule(parse('q:r/r'))
+    assert len(list(t.all_extensions())) == 2
+    assert t.credulous_entail(parse('r'))
+    assert not t.skeptical_entail(parse('r'))
+    t.add_rule(parse('T:p/!p'))
+    assert not t.has_extension()
+    t.remove_rule(parse('T:p/!p'))
+    assert len(list(t.all_extensions())) == 2
+    t.remove_fact(parse('T'))
+    assert not t.credulous_entail(parse('r'))
+    for remove, item in [(t.remove_fact, 'T'), (t.remove_rule, 'T:p/!p')]:
+        try:
+            remove(parse(item))
+            assert False
+        except ValueError as e:
+            assert str(e).endswith('is not in the theory'), e
+
+    t = CPDLogic()
+    t.add_fact(parse('a'))
+    t.add_rule(parse('a:b/b'))
+    t.add_rule(parse('a:!b/!b'))
+    t.add_rule(parse('c:d/d'))
+    assert len(list(t.all_extensions())) == 2
+    s = t.copy()
+    s.add_fact(parse('c'))
+    assert len(list(s.all_extensions())) == 2
+    assert s.counters['reused'] > 0 and s.skeptical_entail(parse('d'))
+    s.add_rule(parse('c:e/e'))
+    assert s.skeptical_entail(parse('e')) and len(t.d) == 3
+    assert not t.credulous_entail(parse('d'))
+
+    t = CPDLogic()
+    t.add_fact(parse('T'))
+    t.add_rule(parse('T:p/p'))
+    extension, = t.all_extensions()
+    assert str(extension) == '{T, p}' and extension.entail(parse('p'))
+    t.add_fact(parse('!p'))
+    assert extension.entail_many([parse('p'), parse('!p')]) == [True, False]
+    assert [str(e) for e in t.all_extensions()] == ['{T, !p}']
+
+    t = CPDLogic()
+    t.add_fact(parse('T'))
+    for rule in ['T:!x & !z/y', 'T:!y & !z/x', 'T:!u & !z/v', 'T:!v & !z/u']:
+        t.add_rule(parse(rule))
+    assert t._parts() is None
+    assert t.credulous_entail_many([parse('y'), parse('x & y')]) \
+            == [True, False]
+    assert t.skeptical_entail_many([parse('x | y'), parse('y')]) \
+            == [True, False]
+    assert t.counters['candidates'] < 16
+    assert len(list(t.all_extensions())) == 4
+
+    from spdl import SPDLogic, AnotherSPDLogic
+    models = []
+    for cls in (SPDLogic, AnotherSPDLogic):
+        t = cls()
+        for fact in ['a', '!a', 'b | c']:
+            t.add_fact(parse(fact))
+        extension, = t.all_extensions()
+        models.append(sorted(repr(sorted(model.items()))
+                for model in extension.models()))
+    assert models[0] == models[1] and len(models[0]) == 3
+    assert all("('a', 'both')" in model for model in models[0])
@@ -9,6 +9,7 @@ PYOBJ_NAME = "pyobj"
 from os import path
 import sys
 import json
+import time
 
 try:
     # raise ImportError
@@ -16,6 +17,7 @@ try:
 except ImportError:
     from PyQt4 import QtCore, QtGui, QtWebKit
     QtCore.Slot = QtCore.pyqtSlot
+    QtCore.Signal = QtCore.pyqtSignal
     from PyQt4.QtGui import QFileDialog
     QFileDialog.getOpenFileName = QFileDialog.getOpenFileNameAndFilter
     QFileDialog.getSaveFileName = QFileDialog.getSaveFileNameAndFilter
@@ -53,8 +55,117 @@ def make_json(error, value, *k, **kw):
     return to_json(obj)
 
 
+class Cancelled(Exception):
+    pass
+
+
+class QueryWorker(QtCore.QThread):
+    ''' Answer a query off the UI thread.
+        `progress` is emitted with the reasoning counters, at most every
+        `interval` seconds, and `done` with the answer, both in JSON.
+        `cancel()` stops the reasoning at its next step.
+    '''
+    progress = QtCore.Signal(str)
+    done = QtCore.Signal(str)
+    interval = 0.2
+
+    def __init__(self, dataset_loader, logic, question, formula):
+        super(QueryWorker, self).__init__()
+        self.dataset_loader = dataset_loader
+        self.logic = logic
+        self.question = question
+        self.formula = formula
+        self.cancelled = False
+        self._last_progress = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _progress(self, counters):
+        if self.cancelled:
+            raise Cancelled
+        now = time.time()
+        if now - self._last_progress >= self.interval:
+            self._last_progress = now
+            self.progress.emit(to_json(dict(counters)))
+
+    def run(self):
+        self.logic.progress = self._progress
+        try:
+            ret = self.dataset_loader.query(self.logic,
+                    self.question, self.formula)
+            ret = make_json(False, ret)
+        except Cancelled:
+            ret = make_json(True, 'Cancelled')
+        except Exception as e:
+            ret = make_json(True, 'Error occurs while asking {} - {}: {}'\
+                    .format(self.question, self.formula, e))
+        finally:
+            # the logic outlives the worker, in a session
+            self.logic.progress = None
+        self.done.emit(ret)
+
+
+class Session(object):
+    ''' The facts and rules of the GUI model, parsed once and kept in sync
+        by deltas, with the logics queried on them.
+        Deltas are applied to the logics when they are next asked for,
+        since a running query may be using them.
+    '''
+    def __init__(self):
+        self.formulas = {'fact': [], 'rule': []}
+        self.logics = {}
+        self.pending = []
+
+    def apply(self, delta):
+        # delta: {op: add/remove/edit/reset, type: fact/rule,
+        #         index (remove, edit), formula (add, edit)}
+        op = delta['op']
+        if op == 'reset':
+            self.__init__()
+            return
+        type_ = delta['type']
+        formulas = self.formulas[type_]
+        if op in ('add', 'edit'):
+            formula = parse(delta['formula'])
+            if not isinstance(formula,
+                    Formula if type_ == 'fact' else DefaultRule):
+                raise ValueError('Illegal {}'.format(type_))
+        if op in ('remove', 'edit'):
+            self.pending.append(('remove', type_,
+                formulas.pop(delta['index'])))
+        if op in ('add', 'edit'):
+            formulas.insert(delta.get('index', len(formulas)), formula)
+            self.pending.append(('add', type_, formula))
+        elif op != 'remove':
+            raise ValueError('Unknown delta {}'.format(op))
+
+    def logic(self, name):
+        for logic in self.logics.values():
+            for op, type_, formula in self.pending:
+                getattr(logic, '{}_{}'.format(op, type_))(formula)
+        self.pending = []
+        if name not in self.logics:
+            logic = LOGIC_MAP[name]()
+            for fact in self.formulas['fact']:
+                logic.add_fact(fact)
+            for rule in self.formulas['rule']:
+                logic.add_rule(rule)
+            self.logics[name] = logic
+        return self.logics[name]
+
+
 class PyObj(QtCore.QObject):
     dataset_loader = DatasetLoader()
+    # relayed from the running QueryWorker
+    progress = QtCore.Signal(str)
+    answered = QtCore.Signal(str)
+    worker = None
+
+    def __init__(self):
+        super(PyObj, self).__init__()
+        self.sessions = {}
+        self._next_session = 0
 
     def error_msg(self, msg, title="Error!"):
         QtGui.QMessageBox.critical(None, title, msg)
@@ -116,27 +227,53 @@ class PyObj(QtCore.QObject):
             return make_json(True, 'Illegal {}'.format(type_))
         return make_json(False, make_latex(f))
 
-    @QtCore.Slot(str, str, str, str, result=str)
-    def query(self, logic, question, formula, model):
+    @QtCore.Slot(result=str)
+    def open_session(self):
+        self._next_session += 1
+        self.sessions[self._next_session] = Session()
+        return make_json(False, self._next_session)
+
+    @QtCore.Slot(int)
+    def close_session(self, session):
+        self.sessions.pop(session, None)
+
+    @QtCore.Slot(int, str, result=str)
+    def sync(self, session, delta):
         try:
-            model = from_json(model)
-            rules, facts = model['rules'], model['facts']
-            rules = [parse(rule) for rule in rules]
-            facts = [parse(fact) for fact in facts]
+            self.sessions[session].apply(from_json(delta))
         except Exception as e:
-            return make_json(True,
-                    'Error occurs while receiving default logic: {}'.format(e))
-        logic = LOGIC_MAP[logic]()
-        for fact in facts:
-            logic.add_fact(fact)
-        for rule in rules:
-            logic.add_rule(rule)
+            return make_json(True, 'Error occurs while syncing: {}'.format(e))
+        return make_json(False, 'Synced')
+
+    def _running(self):
+        return self.worker is not None and self.worker.isRunning()
+
+    @QtCore.Slot(int, str, str, str, result=str)
+    def start_session_query(self, session, logic, question, formula):
+        ''' Ask question on formula over the model of a session; the
+            answer comes by the `answered` signal.
+        '''
+        if self._running():
+            return make_json(True, 'Another query is running')
         try:
-            ret = self.dataset_loader.query(logic, question, formula)
+            logic = self.sessions[session].logic(logic)
         except Exception as e:
-            return make_json(True, 'Error occurs while asking {} - {}: {}'\
-                    .format(question, formula, e))
-        return make_json(False, ret)
+            return make_json(True,
+                    'Error occurs while updating default logic: {}'.format(e))
+        return self._start(logic, question, formula)
+
+    def _start(self, logic, question, formula):
+        self.worker = QueryWorker(self.dataset_loader,
+                logic, question, formula)
+        self.worker.progress.connect(self.progress)
+        self.worker.done.connect(self.answered)
+        self.worker.start()
+        return make_json(False, 'Running')
+
+    @QtCore.Slot()
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
 
 
 def main(*argv):
@@ -8,6 +8,25 @@ var df_model = {
     'rules': [],
     'facts': []
 };
+// the python side keeps the parsed model, changes are sent as deltas
+var session = $.parseJSON(pyobj.open_session()).value;
+var _sync = function(delta){
+    var ret = $.parseJSON(pyobj.sync(session, toJSON(delta)));
+    if (ret.error) set_query_result(ret);
+    return ret;
+};
+// start the session over from the model the user sees
+var _resync = function(){
+    _sync({'op': 'reset'});
+    $.each(['fact', 'rule'], function(idx, type_){
+        $.each(df_model[type_+"s"], function(idx, formula){
+            _sync({'op': 'add', 'type': type_, 'formula': formula});
+        });
+    });
+};
+$(window).on('unload', function(){
+    pyobj.close_session(session);
+});
 
 var _reset = function(){
     // update model
@@ -15,6 +34,7 @@ var _reset = function(){
         'rules': [],
         'facts': []
     };
+    _sync({'op': 'reset'});
     // update views
     $('#list-fact').empty();
     $('#list-rule').empty();
@@ -24,6 +44,7 @@ var _delete_formula = function(type_, idx){
     $list.children('li').children('button.close').hide();
     // update model
     df_model[type_+"s"].splice(idx, 1);
+    if (_sync({'op': 'remove', 'type': type_, 'index': idx}).error) _resync();
     // update views
     $list.children('li:eq('+idx+')').animate({
         height: '0px',
@@ -37,9 +58,9 @@ var _delete_formula = function(type_, idx){
     });
 };
 var _append_formula = function(type_, formula, value){
-    // update model
-    var model = df_model[type_+"s"];
-    model.push(formula);
+    // update model, unless the session rejects the formula
+    if (_sync({'op': 'add', 'type': type_, 'formula': formula}).error) return;
+    df_model[type_+"s"].push(formula);
     // update views
     var $li = $('<li>').addClass("list-group-item")
         .append(value)
@@ -113,17 +134,37 @@ $('#form-add-rule').submit(function(e){
     e.preventDefault();
     _verify_formula("rule");
 });
+var set_running = function(running) {
+    $('#btn-query').prop('disabled', running);
+    $('#btn-cancel').prop('disabled', !running);
+};
+pyobj.progress.connect(function(counters){
+    counters = $.parseJSON(counters);
+    $('#query-result').removeClass().addClass('alert alert-warning')
+        .text('Running: ' + (counters.candidates || 0) + ' candidate(s) tried, '
+              + (counters.extensions || 0) + ' extension(s) found.');
+});
+pyobj.answered.connect(function(ret){
+    set_running(false);
+    set_query_result($.parseJSON(ret));
+});
+$('#btn-cancel').click(function(){
+    pyobj.cancel();
+});
 $('#form-query').submit(function(e){
     e.preventDefault();
     var logic = $('#logic').val();
     var question = $('#question').val();
     var formula = $('#formula').val();
-    var model = toJSON(df_model);
     var ret;
     if ($.inArray(question, ["credulous_entail", "skeptical_entail"]) !== -1 && is_empty(formula)) {
         ret = {"error": true, "value": "Empty formula!"};
     } else {
-        ret = $.parseJSON(pyobj.query(logic, question, formula, model));
+        ret = $.parseJSON(pyobj.start_session_query(session, logic, question, formula));
+        if (!ret.error) {
+            set_running(true);
+            ret.value = "Running...";
+        }
     }
     set_query_result(ret);
 });
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import re
+from functools import lru_cache
 from symbol import Atom, Not, And, Or, Imply, Implication, Equiv
 from dlogic import DefaultRule
 
@@ -199,7 +200,24 @@ class Parser(object):
             ))
 
 
-parse = Parser().parse
+# distinct strings whose parse results are kept
+PARSE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(string, format):
+    return Parser().parse(string, format)
+
+
+def parse(string, format='str'):
+    ''' Parse string, sharing the result with earlier calls on the same
+        string: formulas are never changed. Syntax errors are not kept.
+        `parse.cache_info()` tells the hits and misses.
+    '''
+    return _parse(string, format)
+
+parse.cache_info = _parse.cache_info
+parse.cache_clear = _parse.cache_clear
 
 
 if __name__ == '__main__':
@@ -216,3 +234,8 @@ if __name__ == '__main__':
     print(try_parse('( d | e | (f&e) -> a )'))
     print(try_parse(' a -> b ->c & ( d | e ->a)'))
     print(try_parse(r'\alpha\to\beta \to\gamma \land(d\lor e\to a)', 'latex'))
+
+    parse.cache_clear()
+    assert parse('a -> b') is parse('a -> b', format='str')
+    assert parse.cache_info().hits == 1
+    assert len(set([parse('a -> b'), parse('(a -> b)'), parse('b -> a')])) == 2
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+
+from itertools import chain, islice
+from collections.abc import Mapping, Sequence
+
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+# bits of the hashes used by PersistentMap
+HASH_BITS = 64
+
+
+class PersistentList(Sequence):
+    ''' An immutable list. `append` returns a new list sharing all but
+        O(log n) of its nodes with the old one, so both can be kept at the
+        cost of their difference.
+        Data Structure:
+            a trie of tuples of WIDTH items, the last (partial) tuple kept
+            apart in `_tail`; `_shift` is the bit shift of the root level.
+    '''
+    __slots__ = ('_size', '_shift', '_root', '_tail')
+
+    def __init__(self, items=()):
+        self._size, self._shift, self._root, self._tail = 0, BITS, (), ()
+        for item in items:
+            self._push(item)
+
+    def _tail_offset(self):
+        if self._size < WIDTH:
+            return 0
+        return (self._size - 1) >> BITS << BITS
+
+    def _leaf(self, index):
+        if index >= self._tail_offset():
+            return self._tail
+        node = self._root
+        for level in range(self._shift, 0, -BITS):
+            node = node[index >> level & MASK]
+        return node
+
+    def _push(self, item):
+        # in place, only while the list is built
+        if self._size - self._tail_offset() < WIDTH:
+            self._tail += (item,)
+        else:
+            if self._size >> BITS > 1 << self._shift:
+                self._root = (self._root, _path(self._shift, self._tail))
+                self._shift += BITS
+            else:
+                self._root = self._push_tail(self._shift, self._root)
+            self._tail = (item,)
+        self._size += 1
+
+    def _push_tail(self, level, parent):
+        # parent with the full tail added at its end
+        index = (self._size - 1) >> level & MASK
+        if level == BITS:
+            node = self._tail
+        elif index < len(parent):
+            node = self._push_tail(level - BITS, parent[index])
+        else:
+            node = _path(level - BITS, self._tail)
+        return parent[:index] + (node,)
+
+    def _new(self):
+        obj = PersistentList.__new__(PersistentList)
+        obj._size, obj._shift = self._size, self._shift
+        obj._root, obj._tail = self._root, self._tail
+        return obj
+
+    def append(self, item):
+        obj = self._new()
+        obj._push(item)
+        return obj
+
+    def extend(self, items):
+        obj = self._new()
+        for item in items:
+            obj._push(item)
+        return obj
+
+    def delete(self, index, stop=None):
+        # the list without the item at index, or the items from index to
+        # stop; unlike the other updates it is built anew
+        start, stop, step = slice(index, stop if stop is not None
+                else index + 1).indices(self._size)
+        if stop <= start:
+            return self
+        return PersistentList(chain(islice(self, start),
+                islice(self, stop, None)))
+
+    def remove(self, item):
+        return self.delete(self.index(item))
+
+    def _leaves(self):
+        def walk(node, level):
+            if level == 0:
+                yield node
+            else:
+                for child in node:
+                    yield from walk(child, level - BITS)
+        if self._size > WIDTH:
+            yield from walk(self._root, self._shift)
+        yield self._tail
+
+    def __iter__(self):
+        for leaf in self._leaves():
+            yield from leaf
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('list index out of range')
+        return self._leaf(index)[index & MASK]
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Sequence) or len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        return self.extend(other)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, list(self))
+
+
+def _path(level, node):
+    while level:
+        node = (node,)
+        level -= BITS
+    return node
+
+
+class _Node(object):
+    # one level of the trie: `entries` of the slots set in `bitmap`,
+    # each a (key, order, value) leaf or a deeper node
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _Bucket(object):
+    # leaves whose keys have the same hash
+    __slots__ = ('entries',)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+def _hash(key):
+    return hash(key) & (1 << HASH_BITS) - 1
+
+
+def _slot(node, h, shift):
+    bit = 1 << (h >> shift & MASK)
+    return bit, bin(node.bitmap & bit - 1).count('1')
+
+
+def _replace(entries, index, entry):
+    return entries[:index] + (entry,) + entries[index + 1:]
+
+
+def _merge(shift, leaf1, h1, leaf2, h2):
+    if shift >= HASH_BITS:
+        return _Bucket((leaf1, leaf2))
+    i1, i2 = h1 >> shift & MASK, h2 >> shift & MASK
+    if i1 == i2:
+        return _Node(1 << i1, (_merge(shift + BITS, leaf1, h1, leaf2, h2),))
+    if i1 > i2:
+        leaf1, leaf2 = leaf2, leaf1
+    return _Node(1 << i1 | 1 << i2, (leaf1, leaf2))
+
+
+def _find(node, h, key):
+    # the leaf of key, None if it is missing
+    while type(node) is _Node:
+        bitmap = node.bitmap
+        bit = 1 << (h & MASK)
+        if not bitmap & bit:
+            return None
+        node = node.entries[bin(bitmap & bit - 1).count('1')]
+        if type(node) is tuple:
+            return node if node[0] == key else None
+        h >>= BITS
+    for leaf in node.entries:
+        if leaf[0] == key:
+            return leaf
+    return None
+
+
+def _set(node, shift, h, leaf):
+    # node with leaf, keeping the order of a leaf it replaces;
+    # return the new node and the replaced leaf, if any
+    if isinstance(node, _Bucket):
+        for old in node.entries:
+            if old[0] == leaf[0]:
+                leaf = (leaf[0], old[1], leaf[2])
+                entries = tuple(e for e in node.entries if e is not old)
+                return _Bucket(entries + (leaf,)), old
+        return _Bucket(node.entries + (leaf,)), None
+    bit, index = _slot(node, h, shift)
+    entries = node.entries
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit,
+                entries[:index] + (leaf,) + entries[index:]), None
+    entry = old = entries[index]
+    if type(entry) is not tuple:
+        entry, old = _set(entry, shift + BITS, h, leaf)
+    elif entry[0] == leaf[0]:
+        entry = (leaf[0], old[1], leaf[2])
+    else:
+        entry, old = _merge(shift + BITS, entry, _hash(entry[0]), leaf, h), \
+                None
+    return _Node(node.bitmap, _replace(entries, index, entry)), old
+
+
+def _delete(node, shift, h, key):
+    # node without key, None if it is left empty
+    if isinstance(node, _Bucket):
+        entries = tuple(e for e in node.entries if e[0] != key)
+        return _Bucket(entries) if entries else None
+    bit, index = _slot(node, h, shift)
+    entries = node.entries
+    entry = entries[index]
+    if not isinstance(entry, tuple):
+        entry = _delete(entry, shift + BITS, h, key)
+        if entry is not None:
+            return _Node(node.bitmap, _replace(entries, index, entry))
+    if node.bitmap == bit:
+        return None
+    return _Node(node.bitmap & ~bit, entries[:index] + entries[index + 1:])
+
+
+def _leaves(node):
+    for entry in node.entries:
+        if isinstance(entry, tuple):
+            yield entry
+        else:
+            yield from _leaves(entry)
+
+
+class PersistentMap(Mapping):
+    ''' An immutable dict, iterated in insertion order. `set` and
+        `delete` return a new map sharing all but O(log n) of its nodes
+        with the old one.
+        Data Structure:
+            a hash array mapped trie of (key, order, value) leaves, where
+            order is the position of the first insertion of key.
+    '''
+    __slots__ = ('_root', '_size', '_next')
+
+    def __init__(self, items=()):
+        self._root, self._size, self._next = _Node(0, ()), 0, 0
+        if isinstance(items, Mapping):
+            items = items.items()
+        for key, value in items:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        self._root, old = _set(self._root, 0, _hash(key),
+                (key, self._next, value))
+        if old is None:
+            self._next += 1
+            self._size += 1
+
+    def _new(self):
+        obj = PersistentMap.__new__(PersistentMap)
+        obj._root, obj._size, obj._next = self._root, self._size, self._next
+        return obj
+
+    def set(self, key, value):
+        obj = self._new()
+        obj._set(key, value)
+        return obj
+
+    def delete(self, key):
+        h = _hash(key)
+        if _find(self._root, h, key) is None:
+            raise KeyError(key)
+        obj = self._new()
+        obj._root = _delete(self._root, 0, h, key) or _Node(0, ())
+        obj._size -= 1
+        return obj
+
+    def __getitem__(self, key):
+        leaf = _find(self._root, _hash(key), key)
+        if leaf is None:
+            raise KeyError(key)
+        return leaf[2]
+
+    def get(self, key, default=None):
+        leaf = _find(self._root, _hash(key), key)
+        return default if leaf is None else leaf[2]
+
+    def __contains__(self, key):
+        return _find(self._root, _hash(key), key) is not None
+
+    def __iter__(self):
+        for leaf in sorted(_leaves(self._root), key=lambda leaf: leaf[1]):
+            yield leaf[0]
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, dict(self.items()))
+
+
+if __name__ == '__main__':
+    import random
+    l = PersistentList()
+    lists = [l]
+    for i in range(3000):
+        l = l.append(i)
+        lists.append(l)
+    for n, l in enumerate(lists):
+        assert len(l) == n
+    assert list(lists[1000]) == list(range(1000))
+    assert lists[2000][1234] == 1234 and lists[2000][-1] == 1999
+    assert lists[40][35:38] == [35, 36, 37]
+    assert lists[1100] == list(range(1100)) and lists[10] != lists[11]
+    l = lists[1500]
+    for start, stop in [(0, None), (31, None), (32, 64), (1000, 1499)]:
+        expected = list(range(1500))
+        del expected[start:stop if stop is not None else start + 1]
+        assert list(l.delete(start, stop)) == expected
+    assert list(l) == list(range(1500))
+    assert l.remove(7).index(8) == 7 and 7 in l
+    assert PersistentList('abc') + 'de' == list('abcde')
+
+    m = PersistentMap()
+    maps = [m]
+    keys = list(range(2000)) + ['x', (1, 2), -1, 2 ** 70]
+    for key in keys:
+        m = m.set(key, str(key))
+        maps.append(m)
+    assert list(maps[5]) == keys[:5] and list(m) == keys
+    assert m == dict((key, str(key)) for key in keys)
+    assert 'x' not in maps[2000] and maps[2001]['x'] == 'x'
+    random.seed(1)
+    removed = random.sample(keys, 500)
+    d = dict(m.items())
+    for key in removed:
+        m = m.delete(key)
+        del d[key]
+    assert m == d and list(m) == list(d) and len(maps[-1]) == len(keys)
+    assert list(m.set(keys[1], 'y')) == list(m)
+    try:
+        m.delete(removed[0])
+        assert False
+    except KeyError:
+        pass
+
+    class Collide(object):
+        def __init__(self, n):
+            self.n = n
+
+        def __hash__(self):
+            return 42
+
+        def __eq__(self, other):
+            return self.n == other.n
+    a, b, c = Collide(1), Collide(2), Collide(3)
+    m = PersistentMap([(a, 1), (b, 2), (c, 3)])
+    assert m[b] == 2 and len(m.delete(b)) == 2 and b not in m.delete(b)
+    assert m.delete(a).delete(b).delete(c) == {}
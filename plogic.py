@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 
 import pycosat
-from symbol import Atom, Not, And, Or, Imply, Implication, Equiv, LogicObject
-from visitor import collect_atoms, to_latex, to_CNF, PNNFTransformer
+from itertools import chain, islice
+from symbol import Atom, Not, And, Or, Imply, Implication, Equiv, \
+        LogicObject, symbol_table
+from bdd import BDD, BDDOverflow
+from persistent import PersistentList, PersistentMap
+from visitor import collect_atoms, to_latex, to_CNF, PNNFTransformer, \
+        ClauseCompiler
 
 
 class PropositionalLogic(LogicObject):
+    ''' Formulas, atoms and what is derived from them are persistent:
+        `copy()` shares them and takes constant time, and a copy changed
+        afterwards never changes the theory it was copied from.
+    '''
     def __init__(self, formulas=None):
         self.reset()
         if formulas:
@@ -13,25 +22,78 @@ class PropositionalLogic(LogicObject):
                 self.add(formula)
 
     def add(self, formula):
-        self.formulas.append(formula)
+        self.formulas = self.formulas.append(formula)
         atoms = collect_atoms(formula)
         self.add_atoms(atoms)
+        self._use(set(atom.name for atom in atoms), 1)
         self._add(formula)
 
+    def remove(self, formula):
+        ''' Retract formula, which must have been added, with the atoms
+            only it used.
+        '''
+        try:
+            index = self.formulas.index(formula)
+        except ValueError:
+            raise ValueError('{} is not in the theory'.format(formula)) \
+                    from None
+        self._count_uses()
+        self.formulas = self.formulas.delete(index)
+        self._remove(index)
+        names = set(atom.name for atom in collect_atoms(formula))
+        self._use(names, -1)
+        for name in names:
+            if name not in self._uses:
+                self.atoms = self.atoms.delete(name)
+
+    def _count_uses(self):
+        # count the formulas using each atom; only theories retracted
+        # from pay for it, the counts being kept from then on
+        if self._uses is None:
+            uses = {}
+            for formula in self.formulas:
+                for name in set(atom.name for atom in collect_atoms(formula)):
+                    uses[name] = uses.get(name, 0) + 1
+            for names in self._kept_names():
+                for name in names:
+                    uses[name] = uses.get(name, 0) + 1
+            self._uses = PersistentMap(uses)
+
+    def _use(self, names, step):
+        # add step to the uses of names, once they are counted
+        if self._uses is None:
+            return
+        uses = self._uses
+        for name in names:
+            count = uses.get(name, 0) + step
+            uses = uses.set(name, count) if count else uses.delete(name)
+        self._uses = uses
+
+    def _kept_names(self):
+        # names of the atoms of each use that is never retracted
+        return ()
+
     def add_atoms(self, atoms):
         for atom in atoms:
             self._add_atom(atom)
 
     def reset(self):
-        self.formulas = []
-        self.atoms = {}
+        self.formulas = PersistentList()
+        self.atoms = PersistentMap()
+        # atom names to the number of their uses, None until counted
+        self._uses = None
 
     def copy(self):
         obj = self.__class__()
-        obj.formulas = self.formulas.copy()
-        obj.atoms = self.atoms.copy()
+        obj.formulas = self.formulas
+        obj.atoms = self.atoms
+        obj._uses = self._uses
         return obj
 
+    def subtheory(self, formulas):
+        # a theory of the same kind, holding `formulas` only
+        return self.__class__(formulas)
+
     def __repr__(self):
         return '{}({})'.format(self.__class__.__name__,
                 ', '.join(map(repr, self.formulas)))
@@ -39,91 +101,346 @@ class PropositionalLogic(LogicObject):
     def __str__(self):
         return '{{{}}}'.format(', '.join(map(str, self.formulas)))
 
+    def context_key(self):
+        # what, besides the formulas, decides the models of the theory
+        return ()
+
     def _add_atom(self, atom):
-        # return isNewFlag, AtomNumber
-        atoms = self.atoms
-        name = atom.name
-        if name in atoms:
-            return False, atoms[name]
-        num = len(atoms) + 1
-        atoms[name] = num
+        return self._add_atom_name(atom.name)
+
+    def _add_atom_name(self, name):
+        # return isNewFlag, AtomNumber, numbered by `symbol_table`
+        num = self.atoms.get(name)
+        if num is not None:
+            return False, num
+        num = symbol_table.id(name)
+        self.atoms = self.atoms.set(name, num)
         return True, num
 
     def _add(self, formula):
         pass
 
+    def _remove(self, index):
+        pass
+
     def sat(self, formula=None):
         raise NotImplementedError
 
     def entail(self, formula):
         raise NotImplementedError
 
+    def sat_many(self, formulas):
+        return [self.sat(formula) for formula in formulas]
+
+    def models(self, atoms=None):
+        raise NotImplementedError
+
+    def compile(self):
+        # a CPLogic equivalent to the theory, over `classical` formulas
+        raise NotImplementedError
+
+    def classical(self, formula):
+        # the formula as it is added to the compiled theory
+        return formula
+
+    def entail_many(self, formulas):
+        return [self.entail(formula) for formula in formulas]
+
 
 class CPLogic(PropositionalLogic):
     def reset(self):
         super(CPLogic, self).reset()
-        self.cnfs = []
+        self.cnfs = PersistentList()
+        # number of clauses of each formula
+        self.clause_counts = PersistentList()
+        self.guarded = PersistentMap()
+        # atoms are numbered densely by solver variables, from 1; `ids`
+        # gives the id in `symbol_table` each variable stands for
+        self.ids = PersistentList()
+        # literals entailed by the theory, found so far, to True
+        self._backbone = PersistentMap()
+        # the last model found, as a set of literals
+        self._model = None
+        # (BDD, root) of cnfs, once compiled
+        self._bdd = None
 
     def copy(self):
         obj = super(CPLogic, self).copy()
-        obj.cnfs = [clause.copy() for clause in self.cnfs]
+        obj.cnfs = self.cnfs
+        obj.clause_counts = self.clause_counts
+        obj.guarded = self.guarded
+        obj.ids = self.ids
+        obj._backbone = self._backbone
+        obj._model = self._model
+        obj._bdd = self._bdd
         return obj
 
-    def _roll_back(self, added_clause, atoms):
-        if added_clause > 0:
-            self.cnfs = self.cnfs[:-added_clause]
-        for name in atoms:
-            del self.atoms[name]
-
-    def _translate_clause_to_numbers(self, clause):
-        num_clause = []
-        new_atoms = {}
-        for literal in clause.sub_formulas:
-            factor = 1
-            if isinstance(literal, Not):
-                literal = literal.sub_formulas[0]
-                factor = -1
-            assert isinstance(literal, Atom)
-            is_new, num = self._add_atom(literal)
-            if is_new:
-                new_atoms[literal.name] = num
-            num *= factor
-            if -num in num_clause:
-                # (!a | a | ...), tautology
-                self._roll_back(0, new_atoms)
-                num_clause = []
-                new_atoms = {}
-                break
-            if num not in num_clause:
-                num_clause.append(num)
-        return num_clause, new_atoms
-
-    def _add(self, formula):
+    def add(self, formula):
+        self.formulas = self.formulas.append(formula)
         # store formula in CNF
-        added_clause = 0
-        new_atoms = {}
-        cnf = to_CNF(formula)
-        for clause in cnf.sub_formulas:
-            # convert atoms to numbers for pycosat
-            num_clause, atoms = self._translate_clause_to_numbers(clause)
-            if num_clause:
-                self.cnfs.append(num_clause)
-                added_clause += 1
-                new_atoms.update(atoms)
-        return added_clause, new_atoms
+        clauses = self._compile_added(formula)
+        self.cnfs = self.cnfs.extend(clauses)
+        self.clause_counts = self.clause_counts.append(len(clauses))
+        # the backbone only grows, the model may be lost
+        for clause in clauses:
+            if len(clause) == 1:
+                self._backbone = self._backbone.set(clause[0], True)
+        if self._model is not None and not self._satisfies(clauses):
+            self._model = None
+        if self._bdd is not None:
+            bdd, root = self._bdd
+            try:
+                root = bdd.conjoin(root, bdd.from_clauses(clauses))
+                self._bdd = (bdd, root)
+            except BDDOverflow:
+                self._bdd = None
+
+    def compile(self):
+        return self.copy()
+
+    def compile_bdd(self, max_nodes=100000):
+        ''' Compile the theory into a BDD, against which consistency with
+            a conjunction of literals, hence clausal entailment, takes time
+            linear in its size. Other queries are compiled too and checked
+            against it, falling back to SAT when either has more than
+            max_nodes nodes. Return whether the theory fitted.
+        '''
+        bdd = BDD(max_nodes)
+        try:
+            self._bdd = (bdd, bdd.from_clauses(self.cnfs))
+        except BDDOverflow:
+            self._bdd = None
+        return self._bdd is not None
+
+    def _bdd_sat(self, clauses):
+        # sat of the theory with clauses by its BDD, None if too large
+        bdd, root = self._bdd
+        if all(len(clause) == 1 for clause in clauses):
+            assignment = {}
+            for clause in clauses:
+                literal = clause[0]
+                if assignment.setdefault(abs(literal), literal > 0) \
+                        != (literal > 0):
+                    return False
+            return bdd.consistent(root, assignment)
+        query = BDD(bdd.max_nodes)
+        try:
+            return bdd.conjoinable(root, query, query.from_clauses(clauses))
+        except BDDOverflow:
+            return None
+
+    def _add_atom_name(self, name):
+        num = self.atoms.get(name)
+        if num is not None:
+            return False, num
+        self.ids = self.ids.append(symbol_table.id(name))
+        num = len(self.ids)
+        self.atoms = self.atoms.set(name, num)
+        return True, num
 
-    def sat(self, formula=None):
-        if formula:
-            added_clause, new_atoms = self._add(formula)
-        ret = pycosat.solve(self.cnfs)
-        if formula:
-            self._roll_back(added_clause, new_atoms)
+    def _variable(self, name, new):
+        # the variable of atom `name`; atoms the theory does not have get
+        # the next ones, in `new`
+        variable = self.atoms.get(name)
+        if variable is None:
+            variable = new.get(name)
+            if variable is None:
+                variable = new[name] = len(self.ids) + len(new) + 1
+        return variable
+
+    def _compile(self, formula, new):
+        ''' Clauses of formula over the variables of the theory, those
+            of its other atoms being added to `new`. The theory is left
+            untouched, so that queries can run in parallel.
+        '''
+        return list(ClauseCompiler(lambda name: self._variable(name, new))
+                .visit(formula))
+
+    def _compile_added(self, formula):
+        # clauses of formula, its atoms being added to the theory
+        numbers = {}
+        for atom in collect_atoms(formula):
+            if atom.name not in numbers:
+                numbers[atom.name] = self._add_atom(atom)[1]
+        self._use(numbers, 1)
+        return list(ClauseCompiler(numbers.__getitem__).visit(formula))
+
+    def _remove(self, index):
+        start = sum(islice(self.clause_counts, index))
+        self.cnfs = self.cnfs.delete(start, start + self.clause_counts[index])
+        self.clause_counts = self.clause_counts.delete(index)
+        # what was entailed may not be any more, the model still holds
+        self._backbone = PersistentMap()
+        self._bdd = None
+
+    def _kept_names(self):
+        # guarded atoms and selectors are never removed
+        name = lambda variable: symbol_table.name(self.ids[variable - 1])
+        for selector, clauses in self.guarded.items():
+            names = set(name(abs(literal))
+                    for clause in clauses for literal in clause)
+            names.add(name(selector))
+            yield names
+
+    def add_guarded(self, formula):
+        ''' Add formula guarded by a new selector variable: the formula
+            only holds when the selector is assumed. Return the selector.
+            Guarded clauses are kept apart and only handed to the solver
+            when their selector is assumed, which is equivalent to adding
+            them with the negated selector.
+        '''
+        clauses = self._compile_added(formula)
+        # named by position, theories guarding alike share selectors
+        name = '#{}'.format(len(self.guarded))
+        selector = self._add_atom_name(name)[1]
+        self._use([name], 1)
+        self.guarded = self.guarded.set(selector, clauses)
+        return selector
+
+    def _assume(self, assumptions):
+        clauses = []
+        for literal in assumptions:
+            if literal in self.guarded:
+                clauses += self.guarded[literal]
+            else:
+                clauses.append([literal])
+        return clauses
+
+    def _satisfies(self, clauses):
+        model = self._model
+        return all(not model.isdisjoint(clause) for clause in clauses)
+
+    def _known(self, clauses, use_model=True):
+        # whether the theory with `clauses` is satisfiable, if the backbone
+        # or (with `use_model`) the last model tells; None otherwise
+        if any(len(clause) == 1 and -clause[0] in self._backbone
+                for clause in clauses):
+            return False
+        if use_model and self._model is not None \
+                and self._satisfies(clauses):
+            return True
+        return None
+
+    def _solve(self, clauses):
+        # a model of the theory with `clauses` as a set of literals, None
+        # if there is none; the model and a refuted unit are kept
+        model = pycosat.solve(chain(self.cnfs, clauses))
         # FIXME
-        return ret not in ('UNSAT', 'UNKNOWN')
+        if model in ('UNSAT', 'UNKNOWN'):
+            if len(clauses) == 1 and len(clauses[0]) == 1:
+                # other threads and copies may read it at once
+                self._backbone = self._backbone.set(-clauses[0][0], True)
+            return None
+        self._model = model = set(model)
+        return model
+
+    def sat(self, formula=None, assumptions=()):
+        clauses = self._assume(assumptions)
+        if formula:
+            clauses += self._compile(formula, {})
+        return self._sat(clauses)
+
+    def _sat(self, clauses):
+        ret = self._known(clauses)
+        if ret is None and self._bdd is not None:
+            ret = self._bdd_sat(clauses)
+            if ret is False and len(clauses) == 1 and len(clauses[0]) == 1:
+                self._backbone = self._backbone.set(-clauses[0][0], True)
+        if ret is None:
+            ret = self._solve(clauses) is not None
+        return ret
+
+    def backbone(self):
+        ''' Literals true in every model, None if there is no model.
+            Each solver call either proves a literal or drops the
+            candidates its model falsifies.
+        '''
+        # by the solver, not the BDD: each step needs a model
+        if self._model is None and self._solve([]) is None:
+            return None
+        candidates = set(self._model).difference(self._backbone)
+        for literal in sorted(candidates, key=abs):
+            if literal in candidates:
+                if self._solve([[-literal]]) is not None:
+                    candidates &= self._model
+        literals = []
+        for name, num in self.atoms.items():
+            if num in self._backbone:
+                literals.append(Atom(name))
+            elif -num in self._backbone:
+                literals.append(Not(Atom(name)))
+        return literals
 
     def entail(self, formula):
         return not self.sat(Not(formula))
 
+    def models(self, atoms=None):
+        ''' Distinct assignments of atoms (all atoms by default) in the
+            models of the theory, as dicts from name to bool. Each model
+            is blocked on the chosen atoms only, so every assignment is
+            found once whatever the other atoms are.
+        '''
+        if atoms is None:
+            atoms = [name for name in self.atoms if not name.startswith('#')]
+        atoms = list(atoms)
+        new = {}
+        nums = [self._variable(name, new) for name in atoms]
+        top = len(self.ids) + len(new)
+        blocks = []
+        while True:
+            model = pycosat.solve(chain(self.cnfs, blocks), vars=top)
+            if model in ('UNSAT', 'UNKNOWN'):
+                return
+            model = set(model)
+            values = [num in model for num in nums]
+            yield dict(zip(atoms, values))
+            if not nums:
+                return
+            blocks.append([-num if value else num
+                for num, value in zip(nums, values)])
+
+    def sat_many(self, formulas, use_models=True, assumptions=()):
+        ''' `sat` for each of formulas, under `assumptions` as for `sat`.
+            Each formula is solved with the theory and the assumed clauses
+            only, after the backbone and the BDD had their say. With
+            `use_models`, the last model and each model found for one
+            formula also answer the pending formulas they satisfy.
+        '''
+        new = {}
+        queries = [self._compile(formula, new) for formula in formulas]
+        assumed = self._assume(assumptions)
+        results = [None] * len(queries)
+        for i, clauses in enumerate(queries):
+            if results[i] is not None:
+                continue
+            clauses = assumed + clauses
+            ret = self._known(clauses, use_models)
+            if ret is None and self._bdd is not None:
+                ret = self._bdd_sat(clauses)
+            if ret is None:
+                model = self._solve(clauses)
+                ret = model is not None
+                if ret and use_models:
+                    for j in range(i + 1, len(queries)):
+                        if results[j] is None and all(
+                                not model.isdisjoint(clause)
+                                for clause in queries[j]):
+                            results[j] = True
+            results[i] = ret
+        return results
+
+    def entail_many(self, formulas):
+        return [not ret for ret in
+                self.sat_many([Not(formula) for formula in formulas])]
+
+
+def fold_dual(value, negated):
+    # one value for an atom and its renamed negation: 'both', True, False,
+    # or None when neither holds
+    if value:
+        return 'both' if negated else True
+    return False if negated else None
+
 
 class SPPLogic(PropositionalLogic):
     _use_cache = True
@@ -132,9 +449,8 @@ class SPPLogic(PropositionalLogic):
     def reset(self):
         super(SPPLogic, self).reset()
         self.set_inconsistents([])
-        self.PNNF_transformer = PNNFTransformer()
         if self._use_cache:
-            self._cached_theory = ([], [], CPLogic())
+            self._cached_theory = ((), PersistentList(), CPLogic())
 
     def copy(self):
         obj = super(SPPLogic, self).copy()
@@ -143,35 +459,112 @@ class SPPLogic(PropositionalLogic):
             obj._cached_theory = self._cached_theory
         return obj
 
-    def _make_theory(self):
-        if self._use_cache \
-                and self.inconsistents == self._cached_theory[0] \
-                and self.formulas == self._cached_theory[1]:
-            theory = self._cached_theory[2]
+    def subtheory(self, formulas):
+        obj = super(SPPLogic, self).subtheory(formulas)
+        obj.set_inconsistents(self.inconsistents)
+        return obj
+
+    def _transformer(self):
+        # one per call, so that theories can be used from many threads
+        transformer = PNNFTransformer()
+        transformer.set_inconsistents(self.inconsistents)
+        return transformer
+
+    def _make_theory(self, transformer):
+        cached = self._cached_theory if self._use_cache else None
+        if cached is not None \
+                and self.inconsistents == cached[0] \
+                and self.formulas == cached[1]:
+            theory = cached[2]
         else:
-            theory = CPLogic([self.PNNF_transformer.visit(formula)
+            theory = CPLogic([transformer.visit(formula)
                 for formula in self.formulas])
             if self._use_cache:
-                self._cached_theory = (self.inconsistents.copy(),
-                        self.formulas.copy(), theory)
+                self._cached_theory = (self.inconsistents,
+                        self.formulas, theory)
         return theory
 
     def set_inconsistents(self, inconsistents):
-        self.inconsistents = list(inconsistents)
+        self.inconsistents = tuple(inconsistents)
+
+    def context_key(self):
+        return tuple(sorted(self.inconsistents))
+
+    def compile(self):
+        transformer = self._transformer()
+        return self._make_theory(transformer).copy()
+
+    def compile_bdd(self, max_nodes=100000):
+        transformer = self._transformer()
+        return self._make_theory(transformer).compile_bdd(max_nodes)
+
+    def classical(self, formula):
+        return self._transformer().visit(formula)
+
+    def backbone(self):
+        # renamed atoms stand for the negation of an inconsistent atom,
+        # their negation tells nothing
+        transformer = self._transformer()
+        literals = self._make_theory(transformer).backbone()
+        if literals is None:
+            return None
+        renamer = transformer.atom_renamer
+        duals = dict((renamer(name), name) for name in self.inconsistents)
+        backbone = []
+        for literal in literals:
+            if isinstance(literal, Atom) and literal.name in duals:
+                backbone.append(Not(Atom(duals[literal.name])))
+            elif isinstance(literal, Atom) \
+                    or literal.sub_formulas[0].name not in duals:
+                backbone.append(literal)
+        return backbone
+
+    def models(self, atoms=None):
+        ''' CPLogic.models over the original atoms. An inconsistent atom
+            and its renamed negation give one value: 'both', True, False,
+            or None when neither holds.
+        '''
+        transformer = self._transformer()
+        if atoms is None:
+            atoms = list(self.atoms)
+        renamer = transformer.atom_renamer
+        inconsistents = set(self.inconsistents)
+        names = list(atoms) + [renamer(name) for name in atoms
+                if name in inconsistents]
+        for model in self._make_theory(transformer).models(names):
+            values = {}
+            for name in atoms:
+                value = model[name]
+                if name in inconsistents:
+                    value = fold_dual(value, model[renamer(name)])
+                values[name] = value
+            yield values
 
     def sat(self, formula=None):
-        self.PNNF_transformer.set_inconsistents(self.inconsistents)
-        theory = self._make_theory()
+        transformer = self._transformer()
+        theory = self._make_theory(transformer)
         if formula is not None:
-            formula = self.PNNF_transformer.visit(formula)
+            formula = transformer.visit(formula)
         return theory.sat(formula)
 
     def entail(self, formula):
-        self.PNNF_transformer.set_inconsistents(self.inconsistents)
-        theory = self._make_theory()
-        formula = self.PNNF_transformer.visit(formula)
+        transformer = self._transformer()
+        theory = self._make_theory(transformer)
+        formula = transformer.visit(formula)
         return theory.entail(formula)
 
+    def sat_many(self, formulas):
+        transformer = self._transformer()
+        theory = self._make_theory(transformer)
+        return theory.sat_many([transformer.visit(formula)
+            for formula in formulas])
+
+    def entail_many(self, formulas):
+        transformer = self._transformer()
+        theory = self._make_theory(transformer)
+        return theory.entail_many([transformer.visit(formula)
+            for formula in formulas])
+
 
 def test(form, org_str, org_form, CNF, latex):
     assert form.__str__() == org_str, form.__str__()
@@ -266,3 +659,129 @@ if __name__ == '__main__':
     assert w.entail(parse('!A & C'))
     w.add(parse('!C'))
     assert w.entail(parse('E'))
+    assert w.entail_many([parse('E'), parse('!A & C'), parse('F')]) \
+            == [True, True, True]
+
+    w = CPLogic()
+    w.add(parse('A | B'))
+    w.add(parse('!C'))
+    assert w.sat_many([parse('A'), parse('B'), parse('C'), parse('A & B')]) \
+            == [True, True, False, True]
+    assert w.entail_many([parse('A | B'), parse('A'), parse('!C | D')]) \
+            == [True, False, True]
+
+    w = CPLogic()
+    w.add(parse('A -> B'))
+    s = w.add_guarded(parse('A'))
+    assert w.sat(parse('!B'))
+    assert not w.sat(parse('!B'), assumptions=[s])
+    assert w.sat(assumptions=[s, -s - 1])
+    assert w.sat_many([parse('B'), parse('!B')], assumptions=[s]) \
+            == [True, False]
+
+    w = CPLogic()
+    w.add(parse('(B <-> (P_1 | P_2))'))
+    b, p, q = [w.atoms[name] for name in ['B', 'P_1', 'P_2']]
+    assert sorted(map(sorted, w.cnfs)) \
+            == sorted(map(sorted, [[-q, b], [-p, b], [-b, p, q]]))
+    assert sorted([b, p, q]) == [1, 2, 3]
+    assert w.ids[b - 1] == symbol_table.id('B')
+
+    w = CPLogic()
+    w.add(parse('A'))
+    w.add(parse('A -> B'))
+    w.add(parse('C | D'))
+    assert w.backbone() == [Atom('A'), Atom('B')]
+    assert w.entail(parse('B')) and not w.entail(parse('C'))
+    w.add(parse('!D'))
+    assert w.entail(parse('C'))
+    assert w.backbone() == [Atom('A'), Atom('B'), Atom('C'), Not(Atom('D'))]
+
+    w = SPPLogic()
+    w.add(parse('A'))
+    w.add(parse('!A'))
+    w.add(parse('B'))
+    assert w.backbone() is None
+    w.set_inconsistents(['A'])
+    assert w.backbone() == [Atom('A'), Not(Atom('A')), Atom('B')]
+
+    # the same backbone whether the BDD answers queries or not
+    formulas = [parse(s) for s in ['A -> B', 'C | D', 'A | E', '!E']]
+    backbone = [Atom('A'), Atom('B'), Not(Atom('E'))]
+    assert CPLogic(formulas).backbone() == backbone
+    for asked in [False, True]:
+        w = CPLogic(formulas)
+        if asked:
+            assert w.sat()
+        assert w.compile_bdd()
+        assert w.sat(parse('C')) and not w.sat(parse('!A'))
+        assert w.backbone() == backbone
+    w = SPPLogic(formulas + [parse('!A')])
+    w.set_inconsistents(['A'])
+    backbone = w.backbone()
+    assert w.compile_bdd() and w.backbone() == backbone
+
+    w = CPLogic()
+    w.add(parse('A -> B'))
+    w.add(parse('B -> C'))
+    assert w.compile_bdd()
+    assert w.entail(parse('A -> C')) and not w.entail(parse('C'))
+    assert w.sat(parse('A & C')) and not w.sat(parse('A & !C'))
+    w.add(parse('A'))
+    assert w._bdd is not None and w.entail(parse('C'))
+    assert not w.compile_bdd(max_nodes=3) and w.entail(parse('C'))
+
+    w = CPLogic()
+    w.add(parse('A | B'))
+    w.add(parse('C'))
+    assert sorted(sorted(m.items()) for m in w.models(['A', 'B'])) == [
+            [('A', False), ('B', True)], [('A', True), ('B', False)],
+            [('A', True), ('B', True)]]
+    assert list(w.models(['C'])) == [{'C': True}]
+    assert len(list(w.models(['D']))) == 2
+
+    w = SPPLogic()
+    w.add(parse('A'))
+    w.add(parse('!A'))
+    w.add(parse('B | !B'))
+    w.set_inconsistents(['A', 'B'])
+    values = sorted(m['B'] is None and 'none' or str(m['B'])
+            for m in w.models())
+    assert values == ['False', 'True', 'both']
+    assert all(m['A'] == 'both' for m in w.models())
+
+    w = SPPLogic()
+    w.add(parse('A'))
+    w.add(parse('!A'))
+    w.add(parse('A <-> B'))
+    assert not w.sat()
+    w.set_inconsistents(['A'])
+    assert w.sat() and not w.entail(parse('B')) and not w.entail(parse('!B'))
+    assert w.entail(parse('!(A <-> B) | A'))
+
+    w = CPLogic()
+    w.add(parse('A -> B'))
+    w.add(parse('A'))
+    assert w.entail(parse('B'))
+    w.remove(parse('A'))
+    assert not w.entail(parse('B')) and 'A' in w.atoms
+    w.remove(parse('A -> B'))
+    assert w.atoms == {} and w.cnfs == []
+
+    w = CPLogic()
+    w.add(parse('A -> B'))
+    v = w.copy()
+    v.add(parse('A'))
+    assert v.entail(parse('B')) and not w.entail(parse('B'))
+    assert 'A' in w.atoms and len(w.cnfs) == 1 and len(v.cnfs) == 2
+    v.remove(parse('A -> B'))
+    assert w.entail(parse('A -> B')) and not v.entail(parse('A -> B'))
+    # uses counted by v, kept up to date as it changes
+    v.add(parse('B & C'))
+    w.remove(parse('A -> B'))
+    assert w.atoms == {} and list(v.atoms) == ['A', 'B', 'C']
+    v.remove(parse('A'))
+    assert list(v.atoms) == ['B', 'C']
+    v.add_guarded(parse('C -> D'))
+    v.remove(parse('B & C'))
+    assert list(v.atoms) == ['C', 'D', '#0']
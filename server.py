@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from symbol import LogicObject, Formula
+from dlogic import DefaultRule
+from dataset import LOGIC_MAP, DatasetLoader
+
+
+class ServerError(Exception):
+    pass
+
+
+class JSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, LogicObject):
+            return str(o)
+        return json.JSONEncoder.default(self, o)
+
+to_json = JSONEncoder().encode
+from_json = json.loads
+
+
+class ReasoningServer(object):
+    ''' Named theories kept compiled in memory, served over a JSON lines
+        protocol: every request is a JSON object on one line, answered by
+        {"id": <id of the request>, "error": bool, "value": ...}.
+        Operations (`op`):
+            create(theory, logic, facts=[], rules=[]), drop(theory), list(),
+            add_fact/remove_fact(theory, formula),
+            add_rule/remove_rule(theory, rule),
+            query(theory, question, formula),
+            query(theory, question, formulas): a list of answers.
+        Queries run in parallel on a pool of threads. Updates run one at
+        a time on another thread and replace the theory by an updated
+        copy, leaving running queries on the old one.
+    '''
+    dataset_loader = DatasetLoader()
+    updates = ('create', 'drop', 'add_fact', 'remove_fact',
+            'add_rule', 'remove_rule')
+
+    def __init__(self, executor=None, workers=4):
+        self.theories = {}
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        self.executor = executor
+        self.updater = ThreadPoolExecutor(max_workers=1)
+
+    def _parse(self, string, type_):
+        return self.dataset_loader.try_parse(string, type_)
+
+    def _theory(self, request):
+        name = request['theory']
+        if name not in self.theories:
+            raise ServerError('No theory named {}'.format(name))
+        return self.theories[name]
+
+    def _update(self, request, method, type_, key):
+        logic = self._theory(request).copy()
+        getattr(logic, method)(self._parse(request[key], type_))
+        self.theories[request['theory']] = logic
+
+    def handle(self, request):
+        func = getattr(self, 'op_{}'.format(request.get('op')), None)
+        if func is None:
+            raise ServerError('Unknown operation {}'.format(request.get('op')))
+        # answers are encoded here, off the event loop
+        return from_json(to_json(func(request)))
+
+    def op_create(self, request):
+        if request['logic'] not in LOGIC_MAP:
+            raise ServerError('Unknown logic {}'.format(request['logic']))
+        logic = LOGIC_MAP[request['logic']]()
+        for fact in request.get('facts', []):
+            logic.add_fact(self._parse(fact, Formula))
+        for rule in request.get('rules', []):
+            logic.add_rule(self._parse(rule, DefaultRule))
+        self.theories[request['theory']] = logic
+        return request['theory']
+
+    def op_drop(self, request):
+        self._theory(request)
+        del self.theories[request['theory']]
+        return request['theory']
+
+    def op_list(self, request):
+        return sorted(self.theories)
+
+    def op_add_fact(self, request):
+        self._update(request, 'add_fact', Formula, 'formula')
+
+    def op_remove_fact(self, request):
+        self._update(request, 'remove_fact', Formula, 'formula')
+
+    def op_add_rule(self, request):
+        self._update(request, 'add_rule', DefaultRule, 'rule')
+
+    def op_remove_rule(self, request):
+        self._update(request, 'remove_rule', DefaultRule, 'rule')
+
+    def op_query(self, request):
+        logic = self._theory(request)
+        if 'formulas' in request:
+            return self.dataset_loader.query_many(logic,
+                    request['question'], request['formulas'])
+        return self.dataset_loader.query(logic,
+                request['question'], request.get('formula'))
+
+    async def respond(self, line):
+        try:
+            request = from_json(line.decode())
+            if not isinstance(request, dict):
+                raise ValueError('not an object')
+        except ValueError as e:
+            return {'id': None, 'error': True,
+                    'value': 'Bad request: {}'.format(e)}
+        loop = asyncio.get_event_loop()
+        executor = self.executor
+        if request.get('op') in self.updates:
+            executor = self.updater
+        try:
+            value = await loop.run_in_executor(executor, self.handle, request)
+        except KeyError as e:
+            value, error = 'Missing {}'.format(e), True
+        except Exception as e:
+            value, error = str(e), True
+        else:
+            error = False
+        return {'id': request.get('id'), 'error': error, 'value': value}
+
+    async def serve_client(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            response = await self.respond(line)
+            writer.write(to_json(response).encode() + b'\n')
+            await writer.drain()
+        writer.close()
+
+    async def serve(self, socket=None, host='127.0.0.1', port=8765):
+        # limit: the longest request line
+        if socket is not None:
+            server = await asyncio.start_unix_server(self.serve_client,
+                    socket, limit=1 << 24)
+        else:
+            server = await asyncio.start_server(self.serve_client,
+                    host, port, limit=1 << 24)
+        async with server:
+            await server.serve_forever()
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description='Serve default theories.')
+    parser.add_argument('--socket', help='listen on this unix socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=4,
+            help='threads answering queries')
+    args = parser.parse_args(argv[1:])
+    server = ReasoningServer(workers=args.workers)
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main(*sys.argv)
@@ -2,12 +2,13 @@
 
 
 from itertools import combinations
-from utils import subseteq, update
+from utils import to_mask
 from symbol import Not, Atom
 from plogic import SPPLogic, CPLogic
 from dlogic import DefaultLogic, DefaultRule, CPDLogic
 from visitor import collect_atoms, subst, subst_all, to_FullPNNF
 from lparser import parse
+from persistent import PersistentMap
 
 
 class SPDLogicSkeleton(DefaultLogic):
@@ -15,7 +16,9 @@ class SPDLogicSkeleton(DefaultLogic):
         Data Structure:
             ground_logic: ground logic for `_cdl`.
             _cdl: a classical default logic to do reasoning.
-            atoms: all atom names occur.
+            atoms: all atom names occur, in order, to their ids.
+            _rule_uses: atom names to the number of defaults using them,
+                None until a retraction needs them.
         Not Implemented:
             _transform_formula(formula):
                 do some transform before add formula.
@@ -38,18 +41,34 @@ class SPDLogicSkeleton(DefaultLogic):
 
     def _make_classic_default_logic(self, incs):
         cdl = self._cdl.copy()
+        # counted for the whole search
+        cdl.counters = self._cdl.counters
         self._set_inconsistents(cdl, incs)
         return cdl
 
+    @property
+    def counters(self):
+        return self._cdl.counters
+
+    @property
+    def progress(self):
+        return self._cdl.progress
+
+    @progress.setter
+    def progress(self, progress):
+        self._cdl.progress = progress
+
     def reset(self):
         super(SPDLogicSkeleton, self).reset()
         self._cdl = CPDLogic(ground_logic=self.ground_logic)
-        self.atoms = []
+        self.atoms = PersistentMap()
+        self._rule_uses = None
 
     def copy(self):
         obj = super(SPDLogicSkeleton, self).copy()
         obj._cdl = self._cdl.copy()
-        obj.atoms = self.atoms.copy()
+        obj.atoms = self.atoms
+        obj._rule_uses = self._rule_uses
         return obj
 
     def add_fact(self, formula):
@@ -62,29 +81,84 @@ class SPDLogicSkeleton(DefaultLogic):
         l = [rule.pre, rule.jus, rule.cons]
         for formula in l:
             self._update_atoms(formula)
+        self._use_rule(rule, 1)
         self._cdl.add_rule(DefaultRule(*list(map(self._transform_formula, l))))
 
+    def remove_fact(self, formula):
+        super(SPDLogicSkeleton, self).remove_fact(formula)
+        self._cdl.remove_fact(self._transform_formula(formula))
+        self._prune_atoms(atom.name for atom in collect_atoms(formula))
+
+    def remove_rule(self, rule):
+        self._count_rule_uses()
+        super(SPDLogicSkeleton, self).remove_rule(rule)
+        self._use_rule(rule, -1)
+        l = [rule.pre, rule.jus, rule.cons]
+        self._cdl.remove_rule(DefaultRule(*list(map(self._transform_formula, l))))
+        self._prune_atoms(self._rule_names(rule))
+
+    def _rule_names(self, rule):
+        return set(atom.name for formula in (rule.pre, rule.jus, rule.cons)
+                for atom in collect_atoms(formula))
+
+    def _count_rule_uses(self):
+        if self._rule_uses is None:
+            uses = {}
+            for rule in self.d:
+                for name in self._rule_names(rule):
+                    uses[name] = uses.get(name, 0) + 1
+            self._rule_uses = PersistentMap(uses)
+
+    def _use_rule(self, rule, step):
+        if self._rule_uses is None:
+            return
+        uses = self._rule_uses
+        for name in self._rule_names(rule):
+            count = uses.get(name, 0) + step
+            uses = uses.set(name, count) if count else uses.delete(name)
+        self._rule_uses = uses
+
+    def _prune_atoms(self, names):
+        # drop those of names no fact nor default uses any more; the facts
+        # keep their own atoms
+        self._count_rule_uses()
+        for name in set(names):
+            if name in self.atoms and name not in self.w.atoms \
+                    and name not in self._rule_uses:
+                self.atoms = self.atoms.delete(name)
+
     def _update_atoms(self, formula):
-        return update(self.atoms,
-                [atom.name for atom in collect_atoms(formula)])
+        for atom in collect_atoms(formula):
+            if atom.name not in self.atoms:
+                self.atoms = self.atoms.set(atom.name, atom.id)
 
     def all_extensions(self):
-        atoms = self.atoms
+        ''' Extensions with minimal sets of inconsistent atoms, each
+            tagged with its set. An unsatisfiable extension is the only one
+            of its set, so a set gives all its extensions or none, and the
+            extensions of different minimal sets differ on atoms they
+            mention: none is given twice.
+        '''
+        # sets of inconsistent atoms are bitsets over positions in `atoms`
+        atoms = list(self.atoms)
         min_incs_set = []
         for inc_count in range(len(atoms) + 1):
-            for incs in combinations(atoms, inc_count):
+            for indices in combinations(range(len(atoms)), inc_count):
+                incs = to_mask(indices)
                 for min_incs in min_incs_set:
-                    if subseteq(min_incs, incs):
+                    if not min_incs & ~incs:
                         break
                 else:
-                    cdl = self._make_classic_default_logic(incs)
+                    names = [atoms[i] for i in indices]
+                    cdl = self._make_classic_default_logic(names)
                     if not cdl.has_extension():
                         continue
                     for extension in cdl.all_extensions():
                         if not extension.sat():
                             break
-                        for atom in incs:
+                        for atom in names:
                             assert extension.sat(self._make_tester(atom))
+                        extension.inconsistents = tuple(names)
                         yield extension
                     else:
                         min_incs_set.append(incs)
@@ -122,22 +196,24 @@ class AnotherSPDLogic(SPDLogicSkeleton):
                 cdl.add_fact(self._make_assert(atom_name))
 
     def _wrap_entail(f):
-        def _f(self, formula):
-            formula = self._transform_formula(formula)
-            old_cdl = self._cdl.copy()
-            for atom in collect_atoms(formula):
-                name = atom.name
-                if name not in self.atoms:
-                    self._cdl.add_fact(self._make_assert(name))
-            ret = getattr(super(AnotherSPDLogic, self), f.__name__)(formula)
-            self._cdl = old_cdl
-            return ret
+        def _f(self, formulas):
+            formulas = [self._transform_formula(formula)
+                    for formula in formulas]
+            # asked on a copy, leaving `self` as it is for other calls
+            obj = self.copy()
+            obj._cdl.counters = self._cdl.counters
+            for formula in formulas:
+                for atom in collect_atoms(formula):
+                    name = atom.name
+                    if name not in self.atoms:
+                        obj._cdl.add_fact(self._make_assert(name))
+            return getattr(super(AnotherSPDLogic, obj), f.__name__)(formulas)
         return _f
 
     @_wrap_entail
-    def credulous_entail(self, formula):
+    def credulous_entail_many(self, formulas):
         pass
 
     @_wrap_entail
-    def skeptical_entail(self, formula):
+    def skeptical_entail_many(self, formulas):
         pass
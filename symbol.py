@@ -1,13 +1,62 @@
 # -*- coding: utf-8 -*-
 
+from threading import Lock
+
 
 class LogicObject(object):
     pass
 
 
+class SymbolTable(object):
+    ''' Stable ids, from 1, for atom names, shared by all formulas and
+        theories, so that theories number atoms alike and can share
+        clauses. Ids are only ever added.
+        Data Structure:
+            ids: name -> id.
+            names: id -> name, names[0] is None.
+            duals: name -> the name of its renamed negation.
+            originals: the name of a renamed negation -> the name.
+    '''
+    def __init__(self):
+        self.ids = {}
+        self.names = [None]
+        self.duals = {}
+        self.originals = {}
+        self._lock = Lock()
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            with self._lock:
+                i = self.ids.get(name)
+                if i is None:
+                    i = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = i
+        return i
+
+    def name(self, i):
+        return self.names[i]
+
+    def top(self):
+        # the greatest id given
+        return len(self.names) - 1
+
+    def dual(self, name):
+        dual = self.duals.get(name)
+        if dual is None:
+            dual = self.duals.setdefault(name, '{}^-'.format(name))
+            self.originals.setdefault(dual, name)
+        return dual
+
+symbol_table = SymbolTable()
+
+
 class Formula(LogicObject):
+    ''' Formulas are not changed once built, so equal ones may be shared
+        (see `lparser.parse`) and hashed. '''
     def __init__(self, *sub_formulas):
-        self.sub_formulas = list(sub_formulas)
+        self.sub_formulas = tuple(sub_formulas)
 
     def __eq__(self, obj):
         if self.__class__ == obj.__class__\
@@ -15,6 +64,11 @@ class Formula(LogicObject):
                     return True
         return False
 
+    def __hash__(self):
+        if not hasattr(self, '_hash'):
+            self._hash = hash((self.__class__, self.sub_formulas))
+        return self._hash
+
 
 class Connector(Formula):
     str_symbol = None
@@ -44,6 +98,7 @@ class Atom(Formula):
     def __init__(self, name):
         super(Atom, self).__init__(name)
         self.name = name
+        self.id = symbol_table.id(name)
 
     def __repr__(self):
         return '{}({})'.format(self.__class__.__name__, self.name)
@@ -1,27 +1,112 @@
 # -*- coding: utf-8 -*-
 
-
-def subseteq(list1, list2):
-    # return set(list1).issubset(set(list2))
-    list1 = list(list1)
-    list2 = list(list2)
-    for i in list1:
-        if not i in list2:
-            return False
-    return True
+from importlib import import_module
+from itertools import chain
 
 
 def flat(list_of_list):
-    return sum(list(list_of_list), [])
+    return list(chain.from_iterable(list_of_list))
+
+
+def bits(mask):
+    # indices of the bits set in `mask`, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def to_mask(indices):
+    mask = 0
+    for index in indices:
+        mask |= 1 << index
+    return mask
+
+
+class LazyMap(dict):
+    ''' A dict whose values may be given as 'module.name', imported when
+        first looked up. '''
+    def __getitem__(self, key):
+        value = super(LazyMap, self).__getitem__(key)
+        if isinstance(value, str):
+            module, name = value.rsplit('.', 1)
+            value = getattr(import_module(module), name)
+            self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+class DisjointSet(object):
+    def __init__(self):
+        self.parent = {}
+
+    def copy(self):
+        obj = self.__class__()
+        obj.parent = self.parent.copy()
+        return obj
+
+    def find(self, item):
+        parent = self.parent
+        root = parent.setdefault(item, item)
+        while root != parent[root]:
+            root = parent[root]
+        while item != root:
+            parent[item], item = root, parent[item]
+        return root
 
+    def union(self, items):
+        # merge the sets of all `items`, return the root of the result
+        root = None
+        for item in items:
+            item_root = self.find(item)
+            if root is None:
+                root = item_root
+            elif item_root != root:
+                self.parent[item_root] = root
+        return root
 
-def update(list1, list2):
-    count = 0
-    for item in list2:
-        if item not in list1:
-            list1.append(item)
-            count += 1
-    return count
+def strongly_connected(graph):
+    ''' Strongly connected components of `graph` (node -> successors),
+        a component is listed after all components it can reach.
+    '''
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    for start in graph:
+        if start in index:
+            continue
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(graph[start]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph[successor])))
+                    break
+                elif successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        item = stack.pop()
+                        on_stack.discard(item)
+                        component.append(item)
+                        if item == node:
+                            break
+                    components.append(component)
+    return components
 
 html_escape_table = {
     "&": "&amp;",
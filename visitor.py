@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from itertools import product
-from symbol import Atom, Not, And, Or, Imply, Implication
+from itertools import product, chain
+from symbol import Atom, Not, And, Or, Imply, Implication, symbol_table
 from utils import flat
 
 
@@ -72,6 +72,9 @@ class LaTeXTransformer(Visitor):
         return r'\{{{}\}}'.format(', '.join(
             self.visit(form) for form in obj.formulas))
 
+    def visitExtension(self, obj):
+        return self.visitPropositionalLogic(obj)
+
     def visitDefaultRule(self, obj):
         return r'\frac{{{}:{}}}{}'.format(self.visit(obj.pre),
                 self.visit(obj.jus), self.visit(obj.cons))
@@ -132,6 +135,78 @@ class CNFTransformer(Visitor):
         return self.visit(And(Imply(left, right), Imply(right, left)))
 
 
+class ClauseCompiler(Visitor):
+    ''' Compile a formula straight into the clauses of its CNF, as lists
+        of atom numbers given by `atom_number(name)`, negative for negated
+        atoms. Same clauses as `to_CNF`, but no Formula is built on the
+        way: a negation is pushed down by visiting its argument with the
+        `visitNot{}` template. Tautological clauses are dropped.
+    '''
+    def __init__(self, atom_number):
+        self.atom_number = atom_number
+
+    def negate(self, formula):
+        return self.dispatch(formula, 'visitNot{}')
+
+    def conjunction(self, cnfs):
+        return chain.from_iterable(cnfs)
+
+    def disjunction(self, cnfs):
+        for clauses in product(*[list(cnf) for cnf in cnfs]):
+            literals = {}
+            for clause in clauses:
+                for literal in clause:
+                    literals[literal] = True
+            if not any(-literal in literals for literal in literals):
+                yield list(literals)
+
+    def visitAtom(self, obj):
+        return [[self.atom_number(obj.name)]]
+
+    def visitNot(self, obj):
+        return self.negate(obj.sub_formulas[0])
+
+    def visitNotAtom(self, obj):
+        return [[-self.atom_number(obj.name)]]
+
+    def visitNotNot(self, obj):
+        return self.visit(obj.sub_formulas[0])
+
+    def visitAnd(self, obj):
+        return self.conjunction(map(self.visit, obj.sub_formulas))
+
+    def visitNotAnd(self, obj):
+        return self.disjunction(map(self.negate, obj.sub_formulas))
+
+    def visitOr(self, obj):
+        return self.disjunction(map(self.visit, obj.sub_formulas))
+
+    def visitNotOr(self, obj):
+        return self.conjunction(map(self.negate, obj.sub_formulas))
+
+    def visitImplyConnector(self, obj):
+        left, right = obj.sub_formulas
+        return self.disjunction([self.negate(left), self.visit(right)])
+
+    def visitNotImplyConnector(self, obj):
+        left, right = obj.sub_formulas
+        return self.conjunction([self.visit(left), self.negate(right)])
+
+    def visitEquiv(self, obj):
+        left, right = obj.sub_formulas
+        return self.conjunction([
+            self.disjunction([self.negate(left), self.visit(right)]),
+            self.disjunction([self.negate(right), self.visit(left)]),
+            ])
+
+    def visitNotEquiv(self, obj):
+        left, right = obj.sub_formulas
+        return self.disjunction([
+            self.conjunction([self.visit(left), self.negate(right)]),
+            self.conjunction([self.visit(right), self.negate(left)]),
+            ])
+
+
 class NNFTransformer(Visitor):
     def visitAtom(self, obj):
         return obj
@@ -158,6 +233,10 @@ class NNFTransformer(Visitor):
         left, right = obj.sub_formulas
         return self.visit(And(left, Not(right)))
 
+    def visitNotEquiv(self, obj):
+        left, right = obj.sub_formulas
+        return self.visit(Or(And(left, Not(right)), And(right, Not(left))))
+
     def visitAnd(self, obj):
         return And(*[self.visit(form) for form in obj.sub_formulas])
 
@@ -172,6 +251,10 @@ class NNFTransformer(Visitor):
         left, right = obj.sub_formulas
         return Implication(self.visit(left), self.visit(right))
 
+    def visitEquiv(self, obj):
+        left, right = obj.sub_formulas
+        return self.visit(And(Imply(left, right), Imply(right, left)))
+
 
 class PNNFTransformer(NNFTransformer):
     """ Transform formula to NNF which has doubt about some inconsistent atoms
@@ -191,7 +274,7 @@ class PNNFTransformer(NNFTransformer):
 
     def atom_renamer(self, name):
         # Not(Atom(name)) ===> Atom(another_name)
-        return '{}^-'.format(name)
+        return symbol_table.dual(name)
 
     def visitNot(self, obj):
         formula = obj.sub_formulas[0]
@@ -261,10 +344,17 @@ class PlainTransformer(Visitor):
 
 
 collect_atoms = AtomCollector().visit
-subst = AtomSubstituter().subst
-subst_all = AtomSubstituter().subst_all
 to_latex = LaTeXTransformer().visit
 to_CNF = CNFTransformer().visit
 to_NNF = NNFTransformer().visit
 to_FullPNNF = FullPNNFTransformer().visit
 to_plain = PlainTransformer().visit
+
+
+def subst(formula, atom_name, substitution):
+    # a substituter per call, its atom map is not shared between threads
+    return AtomSubstituter().subst(formula, atom_name, substitution)
+
+
+def subst_all(formula, d):
+    return AtomSubstituter().subst_all(formula, d)